@@ -0,0 +1,196 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from stub_ollama import ReplayState, StubOllamaServer  # noqa: E402
+
+# lower is better for all of these; success_rate is checked separately
+COMPARED_METRICS = [
+    ('time_to_video', 'p50'),
+    ('time_to_video', 'p95'),
+    ('attempts_per_success', 'p50'),
+    ('attempts_per_success', 'p95'),
+    ('llm_seconds', 'p50'),
+    ('llm_seconds', 'p95'),
+    ('render_seconds', 'p50'),
+    ('render_seconds', 'p95'),
+    ('system_tokens', 'p50'),
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def distribution(values):
+    return {
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'mean': sum(values) / len(values) if values else None,
+    }
+
+
+def summarize(runs):
+    succeeded = [run for run in runs if run['status'] == 'succeeded']
+    return {
+        'jobs': len(runs),
+        'success_rate': len(succeeded) / len(runs) if runs else 0,
+        'time_to_video': distribution([run['seconds'] for run in succeeded]),
+        'attempts_per_success': distribution([run['attempts'] for run in succeeded]),
+        'llm_seconds': distribution([run['timings'].get('llm', 0) for run in runs]),
+        'render_seconds': distribution([
+            run['timings'].get('validate', 0) + run['timings'].get('render', 0) for run in runs
+        ]),
+        'system_tokens': distribution([run['system_tokens'] for run in runs]),
+    }
+
+
+def compare(summary, baseline, tolerance):
+    regressions = []
+    for metric, stat in COMPARED_METRICS:
+        current = summary[metric][stat]
+        # baselines recorded before a metric existed just skip it
+        previous = baseline.get(metric, {}).get(stat)
+        if current is None or previous is None:
+            continue
+        if current > previous * (1 + tolerance):
+            regressions.append(f'{metric}.{stat}: {previous:.3f} -> {current:.3f}')
+    if summary['success_rate'] < baseline['success_rate'] - tolerance:
+        regressions.append(f'success_rate: {baseline["success_rate"]:.2f} -> {summary["success_rate"]:.2f}')
+    return regressions
+
+
+def run_corpus(corpus, pipeline, state, repetitions, warmup, render_workers):
+    from manimgpt.artifacts import ArtifactStore
+    from manimgpt.fixes import FixIndex
+    from manimgpt.llm_cache import ResponseCache
+    from manimgpt.render_cache import RenderCache
+    from manimgpt.render_pool import RenderPool
+    from manimgpt.tracing import Tracer
+
+    render_pool = RenderPool(render_workers)
+    tracer = Tracer()
+    runs = []
+    for repetition in range(warmup + repetitions):
+        # fresh caches (and fix index) every pass, otherwise everything after the first pass is a cache hit
+        with tempfile.TemporaryDirectory() as cache_dir:
+            llm_cache = ResponseCache(os.path.join(cache_dir, 'llm-cache.sqlite'))
+            render_cache = RenderCache(os.path.join(cache_dir, 'render-cache'))
+            fix_index = FixIndex(os.path.join(cache_dir, 'fix-index.sqlite'))
+            artifacts = ArtifactStore(os.path.join(cache_dir, 'artifacts'))
+            # the workers stay warm across passes, but partial movies from the last pass must not be reused
+            render_pool.partial_cache_dir = artifacts.partial_dir
+            for entry in corpus['prompts']:
+                job = {'id': entry['id'], 'prompt': entry['prompt'], 'model': corpus['model']}
+                start = time.perf_counter()
+                result = pipeline.run_job(job, corpus['system_message'], llm_cache, render_pool, render_cache, artifacts, fix_index, tracer)
+                seconds = time.perf_counter() - start
+                if repetition < warmup:
+                    continue
+                runs.append({
+                    'id': entry['id'],
+                    'repetition': repetition - warmup,
+                    'status': result['status'],
+                    'attempts': result['attempts'],
+                    'seconds': seconds,
+                    'timings': result['timings'],
+                    'system_tokens': result['system_tokens'],
+                    'error': result['error'],
+                })
+                print(f'{entry["id"]} #{repetition - warmup}: {result["status"]} in {seconds:.2f}s, {result["attempts"]} attempts')
+        state.reset()
+    render_pool.shutdown()
+    return runs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay recorded model responses through the parse/validate/render pipeline.')
+    parser.add_argument('--corpus', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus.json'))
+    parser.add_argument('--output', default='bench-results.json')
+    parser.add_argument('--baseline', help='results file to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='write this run to --baseline instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative slowdown before flagging a regression')
+    parser.add_argument('--repetitions', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--render-workers', type=int, default=1)
+    parser.add_argument('--prompt-mode', choices=('retrieval', 'static'), default='retrieval',
+                        help='run the corpus system message with or without retrieved docs snippets')
+    args = parser.parse_args()
+    corpus_path = os.path.abspath(args.corpus)
+    output_path = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    with open(corpus_path) as f:
+        corpus = json.load(f)
+    recordings = {
+        entry['prompt']: {
+            'responses': entry['responses'],
+            'tokens_per_second': entry.get('tokens_per_second', corpus.get('tokens_per_second')),
+            'first_token_latency': entry.get('first_token_latency', corpus.get('first_token_latency', 0)),
+        }
+        for entry in corpus['prompts']
+    }
+    state = ReplayState(recordings)
+    server = StubOllamaServer(state).start()
+    # must be set before the provider layer builds its ollama client
+    os.environ['OLLAMA_HOST'] = server.url
+
+    # keep generated scripts and media out of the working tree
+    os.chdir(tempfile.mkdtemp(prefix='manimgpt-bench-'))
+    import one_off_run as pipeline
+    pipeline.bypass_llm_cache = True
+    pipeline.prompt_mode = args.prompt_mode
+
+    runs = run_corpus(corpus, pipeline, state, args.repetitions, args.warmup, args.render_workers)
+    summary = summarize(runs)
+    with open(corpus_path, 'rb') as f:
+        corpus_hash = hashlib.sha256(f.read()).hexdigest()
+    results = {
+        'metadata': {
+            'corpus': os.path.basename(corpus_path),
+            'corpus_sha256': corpus_hash,
+            'repetitions': args.repetitions,
+            'render_workers': args.render_workers,
+            'prompt_mode': args.prompt_mode,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'summary': summary,
+        'runs': runs,
+    }
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(summary, indent=2))
+    print(f'Results written to {output_path}')
+
+    if baseline_path:
+        if args.save_baseline:
+            with open(baseline_path, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f'Baseline saved to {baseline_path}')
+        else:
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+            if baseline['metadata']['corpus_sha256'] != corpus_hash:
+                print('Warning: baseline was recorded against a different corpus')
+            if baseline['metadata'].get('prompt_mode') != args.prompt_mode:
+                print(f'Comparing prompt modes: {baseline["metadata"].get("prompt_mode")} -> {args.prompt_mode}')
+            regressions = compare(summary, baseline['summary'], args.tolerance)
+            for regression in regressions:
+                print(f'REGRESSION {regression}')
+            if regressions:
+                exit(1)
+            print('No regressions against baseline')
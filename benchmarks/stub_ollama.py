@@ -0,0 +1,113 @@
+import collections
+import hashlib
+import http.server
+import json
+import threading
+import time
+
+CHUNK_SIZE = 16
+
+
+def prompt_key(prompt):
+    return hashlib.sha1(prompt.strip().encode()).hexdigest()
+
+
+class ReplayState:
+    def __init__(self, recordings, tokens_per_second=None):
+        # recordings: {prompt: {'responses': [...], 'tokens_per_second': ..., 'first_token_latency': ...}}
+        self.recordings = {prompt_key(prompt): recording for prompt, recording in recordings.items()}
+        self.tokens_per_second = tokens_per_second
+        self.calls = collections.Counter()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+
+    def next_response(self, messages):
+        prompt = next((m['content'] for m in messages if m['role'] == 'user'), '')
+        key = prompt_key(prompt)
+        recording = self.recordings.get(key)
+        if recording is None:
+            return None, None
+        with self._lock:
+            index = self.calls[key]
+            self.calls[key] += 1
+        responses = recording['responses']
+        # replay the last recorded response if the pipeline asks for more than were recorded
+        return responses[min(index, len(responses) - 1)], recording
+
+
+class StubOllamaHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = self._read_json()
+        if self.path == '/api/generate':
+            self._send_json(200, {'model': body.get('model'), 'response': '', 'done': True})
+            return
+        if self.path != '/api/chat':
+            self._send_json(404, {'error': f'unknown path {self.path}'})
+            return
+        response, recording = self.server.state.next_response(body.get('messages', []))
+        if response is None:
+            self._send_json(404, {'error': 'no recorded response for this prompt'})
+            return
+        self._stream(body.get('model'), response, recording)
+
+    def _stream(self, model, response, recording):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        time.sleep(recording.get('first_token_latency', 0))
+        tokens_per_second = recording.get('tokens_per_second', self.server.state.tokens_per_second)
+        try:
+            for start in range(0, len(response), CHUNK_SIZE):
+                chunk = response[start:start + CHUNK_SIZE]
+                if tokens_per_second:
+                    # ~4 characters per token
+                    time.sleep(len(chunk) / 4 / tokens_per_second)
+                self._write_chunk({'model': model, 'message': {'role': 'assistant', 'content': chunk}, 'done': False})
+            self._write_chunk({'model': model, 'message': {'role': 'assistant', 'content': ''}, 'done': True})
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # the client stops reading once the code block is closed
+            pass
+
+    def _write_chunk(self, body):
+        data = json.dumps(body).encode() + b'\n'
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+
+class StubOllamaServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, state, host='127.0.0.1', port=0):
+        super().__init__((host, port), StubOllamaHandler)
+        self.state = state
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='stub-ollama', daemon=True).start()
+        return self
@@ -1,8 +1,18 @@
 # !/bin/bash
 
-rm -rf test-scripts/*
 rm -rf media/*
+rm -rf render-cache/*
+python -m manimgpt.artifacts --root artifacts --clean
+rm -f llm-cache.sqlite
+rm -f jobs.sqlite
+rm -f traces.jsonl
+rm -rf retrieval-index
 
 
-rm -rf streamlit-app/test-scripts/*
-rm -rf streamlit-app/media/*
\ No newline at end of file
+rm -rf streamlit-app/media/*
+rm -rf streamlit-app/render-cache/*
+python -m manimgpt.artifacts --root streamlit-app/artifacts --clean
+rm -f streamlit-app/llm-cache.sqlite
+rm -f streamlit-app/jobs.sqlite
+rm -f streamlit-app/traces.jsonl
+rm -rf streamlit-app/retrieval-index
\ No newline at end of file
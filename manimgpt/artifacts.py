@@ -0,0 +1,210 @@
+import argparse
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+KINDS = ('script', 'log', 'image', 'video', 'partial')
+EXTENSIONS = {'script': 'py', 'log': 'log', 'image': 'png', 'video': 'mp4'}
+DEFAULT_QUOTAS_MB = {'script': 100, 'log': 100, 'image': 500, 'video': 5120, 'partial': 5120}
+# anything touched this recently may still be in use by a render in flight
+EVICTION_GRACE = 10 * 60
+
+
+def default_quotas():
+    return {
+        kind: int(os.getenv(f'MANIMGPT_{kind.upper()}_QUOTA_MB', DEFAULT_QUOTAS_MB[kind])) * 1024 ** 2
+        for kind in KINDS
+    }
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                continue
+    return total
+
+
+class ArtifactStore:
+    def __init__(self, root='./artifacts', quotas=None):
+        self.root = os.path.abspath(root)
+        self.quotas = quotas or default_quotas()
+        # manim looks partial movies up by its own hash inside a directory, so those stay
+        # directories (one per scene_key) rather than content-addressed files
+        self.partial_dir = os.path.join(self.root, 'partial')
+        os.makedirs(self.partial_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS artifacts ('
+                'key TEXT PRIMARY KEY, kind TEXT NOT NULL, path TEXT NOT NULL, size INTEGER NOT NULL, '
+                'created REAL NOT NULL, last_access REAL NOT NULL, pinned INTEGER NOT NULL DEFAULT 0)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS refs ('
+                'key TEXT NOT NULL, prompt TEXT, model TEXT, attempt INTEGER, created REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS artifacts_kind_access ON artifacts (kind, last_access)')
+            conn.execute('CREATE INDEX IF NOT EXISTS refs_key ON refs (key)')
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.root, 'index.sqlite'), timeout=30)
+
+    def _path(self, kind, key):
+        return os.path.join(self.root, kind, key[:2], f'{key}.{EXTENSIONS[kind]}')
+
+    def _record(self, key, kind, path, size, prompt, model, attempt):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO artifacts (key, kind, path, size, created, last_access) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET size = excluded.size, last_access = excluded.last_access',
+                (key, kind, path, size, now, now)
+            )
+            if prompt is not None or model is not None or attempt is not None:
+                conn.execute(
+                    'INSERT INTO refs (key, prompt, model, attempt, created) VALUES (?, ?, ?, ?, ?)',
+                    (key, prompt, model, attempt, now)
+                )
+
+    def put_file(self, kind, source_path, move=False, prompt=None, model=None, attempt=None):
+        # identical output from two attempts (or two sessions) is stored once and just gains a reference
+        key = file_hash(source_path)
+        path = self._path(kind, key)
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                (shutil.move if move else shutil.copyfile)(source_path, tmp_path)
+                os.replace(tmp_path, path)
+            elif move:
+                os.remove(source_path)
+            self._record(key, kind, path, os.path.getsize(path), prompt, model, attempt)
+        self.evict(kind)
+        return key, path
+
+    def put_text(self, kind, text, prompt=None, model=None, attempt=None):
+        data = text.encode()
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(kind, key)
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            self._record(key, kind, path, len(data), prompt, model, attempt)
+        self.evict(kind)
+        return key, path
+
+    def track_dir(self, kind, path, prompt=None, model=None, attempt=None):
+        # for directories something else writes into (manim's partial movies); re-measured on every touch
+        key = f'{kind}:{os.path.basename(os.path.normpath(path))}'
+        with self._lock:
+            self._record(key, kind, os.path.abspath(path), dir_size(path), prompt, model, attempt)
+        self.evict(kind)
+        return key
+
+    def get(self, key):
+        with self._lock, self._connect() as conn:
+            row = conn.execute('SELECT path FROM artifacts WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(row[0]):
+                # removed behind our back (clean.sh, a user) -- forget it
+                self._forget(conn, key)
+                return None
+            conn.execute('UPDATE artifacts SET last_access = ? WHERE key = ?', (time.time(), key))
+            return row[0]
+
+    def find(self, kind=None, prompt=None, pinned=None, limit=50):
+        query = (
+            'SELECT a.key, a.kind, a.path, a.size, a.last_access, a.pinned, r.prompt, r.model, r.attempt '
+            'FROM artifacts a LEFT JOIN refs r ON r.rowid = (SELECT MAX(rowid) FROM refs WHERE key = a.key) '
+            'WHERE 1 = 1'
+        )
+        params = []
+        if kind is not None:
+            query += ' AND a.kind = ?'
+            params.append(kind)
+        if prompt is not None:
+            query += ' AND a.key IN (SELECT key FROM refs WHERE prompt = ?)'
+            params.append(prompt)
+        if pinned is not None:
+            query += ' AND a.pinned = ?'
+            params.append(int(pinned))
+        query += ' ORDER BY a.last_access DESC LIMIT ?'
+        params.append(limit)
+        columns = ('key', 'kind', 'path', 'size', 'last_access', 'pinned', 'prompt', 'model', 'attempt')
+        with self._lock, self._connect() as conn:
+            return [dict(zip(columns, row)) for row in conn.execute(query, params)]
+
+    def pin(self, key, pinned=True):
+        with self._lock, self._connect() as conn:
+            conn.execute('UPDATE artifacts SET pinned = ? WHERE key = ?', (int(pinned), key))
+
+    def _forget(self, conn, key):
+        conn.execute('DELETE FROM artifacts WHERE key = ?', (key,))
+        conn.execute('DELETE FROM refs WHERE key = ?', (key,))
+
+    def evict(self, kind=None, everything=False):
+        now = time.time()
+        removed = 0
+        with self._lock, self._connect() as conn:
+            for kind in [kind] if kind else KINDS:
+                total = conn.execute(
+                    'SELECT COALESCE(SUM(size), 0) FROM artifacts WHERE kind = ?', (kind,)
+                ).fetchone()[0]
+                if total <= self.quotas[kind] and not everything:
+                    continue
+                rows = conn.execute(
+                    'SELECT key, path, size, last_access FROM artifacts WHERE kind = ? AND pinned = 0 '
+                    'ORDER BY last_access', (kind,)
+                ).fetchall()
+                for key, path, size, last_access in rows:
+                    if not everything and (total <= self.quotas[kind] or now - last_access < EVICTION_GRACE):
+                        break
+                    self._remove(path)
+                    self._forget(conn, key)
+                    total -= size
+                    removed += 1
+        return removed
+
+    def _remove(self, path):
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect or clean the artifact store.')
+    parser.add_argument('--root', default='./artifacts')
+    parser.add_argument('--clean', action='store_true', help='remove everything that is not pinned')
+    args = parser.parse_args()
+    if not os.path.isdir(args.root):
+        exit(0)
+    store = ArtifactStore(args.root)
+    if args.clean:
+        print(f'Removed {store.evict(everything=True)} artifacts from {args.root}')
+    for artifact in store.find(limit=1000):
+        pinned = 'pinned' if artifact['pinned'] else ''
+        print(f'{artifact["kind"]:8} {artifact["size"]:>12} {pinned:6} {artifact["path"]}')
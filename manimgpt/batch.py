@@ -0,0 +1,91 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def job_id(job):
+    return str(job.get('id') or hashlib.sha1(job['prompt'].encode()).hexdigest()[:12])
+
+
+def load_jobs(path):
+    jobs = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            job = json.loads(line)
+            if 'prompt' not in job:
+                print(f'Skipping line {line_number} of {path}: no "prompt" field')
+                continue
+            job['id'] = job_id(job)
+            jobs.append(job)
+    return jobs
+
+
+def completed_ids(output_path, skip_failed=False):
+    # failed jobs run again unless skip_failed: a provider outage fails every job it touches at once
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+                if skip_failed or result['status'] == 'succeeded':
+                    done.add(result['id'])
+            except (json.JSONDecodeError, KeyError):
+                # the last line can be half-written if the previous run was killed mid-write
+                continue
+    return done
+
+
+class Checkpoint:
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self._lock = threading.Lock()
+
+    def write(self, result):
+        line = json.dumps(result) + '\n'
+        with self._lock, open(self.output_path, 'a') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def run_batch(jobs, run_job, output_path, concurrency, skip_failed=False):
+    # several jobs in flight at once means one job's LLM call overlaps another's render;
+    # the provider semaphores and the render pool size cap each stage on their own
+    done = completed_ids(output_path, skip_failed)
+    pending = [job for job in jobs if job['id'] not in done]
+    print(f'{len(jobs)} jobs, {len(jobs) - len(pending)} already done, {len(pending)} to run')
+    checkpoint = Checkpoint(output_path)
+
+    def run(job):
+        start = time.perf_counter()
+        try:
+            result = run_job(job)
+        except Exception as e:
+            result = {'status': 'failed', 'error': f'{type(e).__name__}: {e}'}
+        result = {'id': job['id'], 'prompt': job['prompt'], **result}
+        result.setdefault('timings', {})['total'] = time.perf_counter() - start
+        checkpoint.write(result)
+        return result
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+    futures = [executor.submit(run, job) for job in pending]
+    succeeded = 0
+    try:
+        for i, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            result = future.result()
+            succeeded += result['status'] == 'succeeded'
+            print(f'[{i}/{len(pending)}] {result["id"]}: {result["status"]}')
+    except KeyboardInterrupt:
+        print('Interrupted -- finished jobs are checkpointed, rerun to resume')
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    return succeeded, len(pending)
@@ -0,0 +1,10 @@
+import re
+
+
+def extract_error_info(error_message: str) -> str:
+    error_type_message = re.search(r'([A-Za-z]+Error: .+)', error_message)
+    if error_type_message:
+        error_type_message = error_type_message.group(1)
+    else:
+        error_type_message = "Error type and message not found."
+    return error_type_message
@@ -0,0 +1,229 @@
+import ast
+import re
+import sqlite3
+import threading
+import time
+
+from manimgpt.errors import extract_error_info
+from manimgpt.history import code_diff
+
+MAX_REPAIRS = 3
+# anything longer is a rewrite of the scene, not a fix that carries over to other prompts
+MAX_HINT_LINES = 24
+MAX_DIFFS_PER_SIGNATURE = 3
+
+EXCEPTION_PATTERN = re.compile(r'^([A-Za-z_][\w.]*(?:Error|Exception)): ?(.*)$', re.M)
+MANIM_FRAME_PATTERN = re.compile(r'File "[^"]*[/\\]manim[/\\]([^"]+)", line \d+, in (\w+)')
+UNDEFINED_NAME_PATTERN = re.compile(r"name '(\w+)' is not defined")
+MISSING_ATTRIBUTE_PATTERN = re.compile(r"has no attribute '(\w+)'")
+RANGE_KWARG_PATTERN = re.compile(r"unexpected keyword argument '[xyz]_(?:min|max)'")
+LATEX_ERROR_PATTERN = re.compile(r'latex error|Missing \$ inserted', re.I)
+
+# manimlib / pre-0.10 community names that models still produce
+RENAMED = {
+    'ShowCreation': 'Create',
+    'TextMobject': 'Tex',
+    'TexMobject': 'MathTex',
+    'ParametricSurface': 'Surface',
+    'get_graph': 'plot',
+}
+MODULE_IMPORTS = {
+    'np': 'import numpy as np',
+    'math': 'import math',
+    'random': 'import random',
+    'itertools': 'import itertools',
+}
+MATH_MARKUP = re.compile(r'[\^_]|\\(?:frac|sqrt|sum|int|prod|lim|partial|nabla|alpha|beta|theta|pi|cdot|times|infty)\b')
+
+
+def message_template(message):
+    message = re.sub(r'(?:[A-Za-z]:)?(?:[\w.-]*[/\\])+[\w.-]+', '<path>', message)
+    message = re.sub(r'0x[0-9a-fA-F]+|\b[0-9a-f]{8,}\b', '<id>', message)
+    message = re.sub(r"'[^']*\s[^']*'", "'<str>'", message)
+    return re.sub(r'\b\d+(?:\.\d+)?\b', '<n>', message).strip()
+
+
+def error_signature(error):
+    # the last exception in a traceback is the one that was raised; validation errors are a single line
+    matches = EXCEPTION_PATTERN.findall(error)
+    if matches:
+        error_type, message = matches[-1]
+    else:
+        error_type, _, message = extract_error_info(error).partition(': ')
+    frames = MANIM_FRAME_PATTERN.findall(error)
+    signature = f'{error_type.rsplit(".", 1)[-1]}: {message_template(message)}'
+    return f'{signature} @ {frames[-1][0]}:{frames[-1][1]}' if frames else signature
+
+
+def _line_starts(code):
+    starts = [0]
+    for line in code.encode().splitlines(keepends=True):
+        starts.append(starts[-1] + len(line))
+    return starts
+
+
+def _span(line_starts, node):
+    # ast offsets are utf-8 byte columns
+    return line_starts[node.lineno - 1] + node.col_offset, line_starts[node.end_lineno - 1] + node.end_col_offset
+
+
+def _apply_edits(code, edits):
+    data = code.encode()
+    last_start = len(data) + 1
+    # back to front so earlier offsets stay valid; overlapping edits are dropped and caught next round
+    for start, end, text in sorted(edits, key=lambda edit: (edit[0], -edit[1]), reverse=True):
+        if end > last_start:
+            continue
+        data = data[:start] + text.encode() + data[end:]
+        last_start = start
+    return data.decode()
+
+
+def _rename_apis(code, tree, error):
+    names = set(UNDEFINED_NAME_PATTERN.findall(error)) | set(MISSING_ATTRIBUTE_PATTERN.findall(error))
+    renames = {name: RENAMED[name] for name in names if name in RENAMED}
+    if not renames:
+        return []
+    line_starts = _line_starts(code)
+    edits = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id in renames:
+            start, end = _span(line_starts, node)
+            edits.append((start, end, renames[node.id]))
+        elif isinstance(node, ast.Attribute) and node.attr in renames:
+            _, end = _span(line_starts, node)
+            edits.append((end - len(node.attr), end, renames[node.attr]))
+    return edits
+
+
+def _range_kwargs(code, tree, error):
+    if not RANGE_KWARG_PATTERN.search(error):
+        return []
+    line_starts = _line_starts(code)
+    edits = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        keywords = {keyword.arg: keyword for keyword in node.keywords}
+        changed = False
+        # the model used the old API for every axis, not just the one Python complained about first
+        for axis in 'xyz':
+            low, high = keywords.get(f'{axis}_min'), keywords.get(f'{axis}_max')
+            if low is None or high is None or f'{axis}_range' in keywords:
+                continue
+            # x_min/x_max became x_range=[min, max] in manim community
+            low.arg, low.value = f'{axis}_range', ast.List([low.value, high.value], ast.Load())
+            node.keywords.remove(high)
+            changed = True
+        if changed:
+            start, end = _span(line_starts, node)
+            edits.append((start, end, ast.unparse(node)))
+    return edits
+
+
+def _missing_imports(code, tree, error):
+    names = set(UNDEFINED_NAME_PATTERN.findall(error))
+    imports = [MODULE_IMPORTS[name] for name in sorted(names) if name in MODULE_IMPORTS]
+    has_manim_import = any(
+        isinstance(node, ast.ImportFrom) and node.module == 'manim' for node in ast.walk(tree)
+    )
+    if names - set(MODULE_IMPORTS) and not has_manim_import:
+        imports.insert(0, 'from manim import *')
+    if not imports:
+        return []
+    return [(0, 0, ''.join(f'{line}\n' for line in imports))]
+
+
+def _math_in_tex(code, tree, error):
+    if not LATEX_ERROR_PATTERN.search(error):
+        return []
+    line_starts = _line_starts(code)
+    edits = []
+    for node in ast.walk(tree):
+        # Tex() typesets text mode, so bare ^ and _ make LaTeX bail with "Missing $ inserted"
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'Tex'
+                and node.args and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)
+                and MATH_MARKUP.search(node.args[0].value) and '$' not in node.args[0].value):
+            start, end = _span(line_starts, node.func)
+            edits.append((start, end, 'MathTex'))
+    return edits
+
+
+RULES = {
+    'rename deprecated APIs': _rename_apis,
+    'x_min/x_max to x_range': _range_kwargs,
+    'add missing imports': _missing_imports,
+    'Tex with math to MathTex': _math_in_tex,
+}
+
+
+def repair(code, error):
+    """Apply every deterministic rewrite that matches the error. Returns (code, rule names) or (None, [])."""
+    applied = []
+    for name, rule in RULES.items():
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            break
+        edits = rule(code, tree, error)
+        if edits:
+            code = _apply_edits(code, edits)
+            applied.append(name)
+    return (code, applied) if applied else (None, [])
+
+
+class FixIndex:
+    def __init__(self, path='./fix-index.sqlite', max_diffs=MAX_DIFFS_PER_SIGNATURE):
+        self.path = path
+        self.max_diffs = max_diffs
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS fixes ('
+                'signature TEXT NOT NULL, diff TEXT NOT NULL, uses INTEGER NOT NULL, last_used REAL NOT NULL, '
+                'PRIMARY KEY (signature, diff))'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def record(self, signature, before_code, after_code):
+        diff = code_diff(before_code, after_code)
+        if not diff or len(diff.splitlines()) > MAX_HINT_LINES:
+            return
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                'INSERT INTO fixes (signature, diff, uses, last_used) VALUES (?, ?, 1, ?) '
+                'ON CONFLICT (signature, diff) DO UPDATE SET uses = uses + 1, last_used = excluded.last_used',
+                (signature, diff, time.time())
+            )
+            conn.execute(
+                'DELETE FROM fixes WHERE signature = ? AND diff IN ('
+                'SELECT diff FROM fixes WHERE signature = ? ORDER BY uses DESC, last_used DESC LIMIT -1 OFFSET ?)',
+                (signature, signature, self.max_diffs)
+            )
+
+    def diffs(self, signature, limit=1):
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                'SELECT diff FROM fixes WHERE signature = ? ORDER BY uses DESC, last_used DESC LIMIT ?',
+                (signature, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def hint(self, error):
+        diffs = self.diffs(error_signature(error))
+        return diffs[0] if diffs else None
+
+
+class FixLearner:
+    # one per job: when an attempt gets past the previous attempt's error, that change fixed it
+    def __init__(self, fix_index):
+        self.fix_index = fix_index
+        self.failure = None
+
+    def observe(self, python_code, error):
+        signature = error_signature(error) if error else None
+        if self.failure and self.failure[0] != signature:
+            self.fix_index.record(self.failure[0], self.failure[1], python_code)
+        self.failure = (signature, python_code) if error else None
@@ -0,0 +1,122 @@
+import difflib
+import re
+
+from manimgpt.errors import extract_error_info
+
+DEFAULT_TOKEN_BUDGET = 6000
+# room left in num_ctx for the model's answer
+RESPONSE_RESERVE = 2048
+MESSAGE_OVERHEAD = 4
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+
+def count_tokens(text):
+    # roughly one BPE token per word or symbol, close enough for code-heavy prompts
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def budget_for_context(num_ctx, token_budget=DEFAULT_TOKEN_BUDGET):
+    return min(token_budget, num_ctx - RESPONSE_RESERVE)
+
+
+def create_message(role, content):
+    return {
+        'role': role,
+        'content': content
+    }
+
+
+def code_diff(old_code, new_code):
+    lines = difflib.unified_diff(old_code.splitlines(), new_code.splitlines(), lineterm='', n=1)
+    return '\n'.join(line for line in lines if not line.startswith(('---', '+++')))
+
+
+class ConversationHistory:
+    def __init__(self, system_message, user_prompt, token_budget=DEFAULT_TOKEN_BUDGET, count_tokens=count_tokens):
+        # system + prompt never change between retries, so providers can reuse their KV/prompt cache for them
+        self.prefix = [create_message('system', system_message), create_message('user', user_prompt)]
+        self.user_prompt = user_prompt
+        self.token_budget = token_budget
+        self.count_tokens = count_tokens
+        self.attempts = []
+
+    def add_attempt(self, response, python_code, error, hint=None):
+        # hint: a diff that fixed the same error signature before, see manimgpt.fixes
+        self.attempts.append({'response': response, 'code': python_code, 'error': error, 'hint': hint})
+
+    def message_tokens(self, message):
+        return self.count_tokens(message['content']) + MESSAGE_OVERHEAD
+
+    def total_tokens(self, messages):
+        return sum(self.message_tokens(message) for message in messages)
+
+    def _summaries(self):
+        summaries = []
+        previous_code = None
+        for i, attempt in enumerate(self.attempts[:-1]):
+            if attempt['code'] is None:
+                summaries.append([f'attempt {i + 1}: no Python code in the response', None])
+                continue
+            diff = code_diff(previous_code, attempt['code']) if previous_code is not None else None
+            summaries.append([f'attempt {i + 1} failed with: {extract_error_info(attempt["error"])}', diff])
+            previous_code = attempt['code']
+        return summaries
+
+    def _feedback(self, summaries, omitted, error, hint):
+        parts = []
+        if summaries or omitted:
+            parts.append('Earlier attempts that also failed:')
+            if omitted:
+                parts.append(f'- {omitted} older attempts omitted')
+            for signature, diff in summaries:
+                parts.append(f'- {signature}')
+                if diff:
+                    parts.append(f'  changes from the attempt before it:\n```diff\n{diff}\n```')
+        latest = self.attempts[-1]
+        if latest['code'] is None:
+            parts.append(f'There was no Python code in your last response. Please provide manim code that can {self.user_prompt}.')
+        else:
+            parts.append(f'Error running your last code:\n{error}')
+            if hint:
+                parts.append(f'A change that fixed this same error in another scene:\n```diff\n{hint}\n```')
+            parts.append(f'Iterate and make manim code that can {self.user_prompt}.')
+        return '\n'.join(parts)
+
+    def messages(self):
+        if not self.attempts:
+            return list(self.prefix)
+        latest = self.attempts[-1]
+        summaries = self._summaries()
+        omitted = 0
+        error = latest['error']
+        response = latest['response']
+        hint = latest['hint']
+
+        def build():
+            return self.prefix + [
+                create_message('assistant', response),
+                create_message('user', self._feedback(summaries, omitted, error, hint)),
+            ]
+
+        # shed detail from the oldest attempts first: diffs, then whole summaries, then the fix hint,
+        # then the prose around the latest code and finally its full traceback
+        messages = build()
+        for summary in summaries:
+            if self.total_tokens(messages) <= self.token_budget:
+                return messages
+            summary[1] = None
+            messages = build()
+        while summaries and self.total_tokens(messages) > self.token_budget:
+            summaries.pop(0)
+            omitted += 1
+            messages = build()
+        if self.total_tokens(messages) > self.token_budget and hint:
+            hint = None
+            messages = build()
+        if self.total_tokens(messages) > self.token_budget and latest['code'] is not None:
+            response = f'```python\n{latest["code"]}\n```'
+            messages = build()
+        if self.total_tokens(messages) > self.token_budget and error:
+            error = extract_error_info(error)
+            messages = build()
+        return messages
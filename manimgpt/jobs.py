@@ -0,0 +1,223 @@
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+DEFAULT_JOB_WORKERS = int(os.getenv('MANIMGPT_JOB_WORKERS', 2))
+FINISHED = ('succeeded', 'failed', 'cancelled')
+
+
+class Job:
+    # the handle a running job sees: emit() appends to its persisted event log, progress holds
+    # state that is only worth keeping while the job runs (streamed model text), and cancel is
+    # set when someone cancels it
+    def __init__(self, server, job_id, owner, params):
+        self.server = server
+        self.id = job_id
+        self.owner = owner
+        self.params = params
+        self.progress = {}
+        self.cancel = threading.Event()
+
+    def emit(self, kind, payload=None):
+        self.server._append_event(self.id, kind, payload)
+
+
+class JobServer:
+    def __init__(self, run, path='./jobs.sqlite', workers=DEFAULT_JOB_WORKERS, recover=None):
+        # run(job) does the work on a server thread and returns a JSON-serializable result,
+        # or None if the job failed. recover(result) is called at startup on every finished job's
+        # result and returns the fields to change, for work that outlived its job but not the process
+        self.run = run
+        self.path = path
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._queued = {}
+        self._running = {}
+        self._running_per_owner = collections.Counter()
+        # owner -> when a worker last picked up one of their jobs
+        self._last_served = {}
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, owner TEXT NOT NULL, params TEXT NOT NULL, status TEXT NOT NULL, '
+                'result TEXT, error TEXT, created REAL NOT NULL, started REAL, finished REAL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS events ('
+                'job_id TEXT NOT NULL, seq INTEGER NOT NULL, kind TEXT NOT NULL, payload TEXT, '
+                'PRIMARY KEY (job_id, seq))'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, created)')
+            # jobs run on this process's threads, so whatever was running when it last stopped is gone;
+            # queued jobs never started and are picked up again
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Interrupted by a server restart', finished = ? "
+                "WHERE status = 'running'", (time.time(),)
+            )
+            if recover is not None:
+                finished = conn.execute('SELECT id, result FROM jobs WHERE result IS NOT NULL').fetchall()
+                for job_id, result in finished:
+                    result = json.loads(result)
+                    fields = recover(result)
+                    if fields:
+                        result.update(fields)
+                        conn.execute('UPDATE jobs SET result = ? WHERE id = ?', (json.dumps(result), job_id))
+            queued = conn.execute(
+                "SELECT id, owner, params FROM jobs WHERE status = 'queued' ORDER BY created"
+            ).fetchall()
+        for job_id, owner, params in queued:
+            self._queued.setdefault(owner, collections.deque()).append(Job(self, job_id, owner, json.loads(params)))
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True).start()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def submit(self, owner, params):
+        job = Job(self, uuid.uuid4().hex[:12], owner, params)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, owner, params, status, created) VALUES (?, ?, ?, 'queued', ?)",
+                (job.id, owner, json.dumps(params), time.time())
+            )
+        with self._wakeup:
+            self._queued.setdefault(owner, collections.deque()).append(job)
+            self._wakeup.notify()
+        return job.id
+
+    def _next(self):
+        # fair share: the owner with the fewest jobs running goes next, ties to whoever was served
+        # least recently, so one user's batch of prompts can't hold every worker while someone else waits
+        owner = min(self._queued, key=lambda owner: (self._running_per_owner[owner], self._last_served.get(owner, 0)))
+        jobs = self._queued[owner]
+        job = jobs.popleft()
+        if not jobs:
+            del self._queued[owner]
+        self._last_served[owner] = time.monotonic()
+        return job
+
+    def _work(self):
+        while True:
+            with self._wakeup:
+                while not self._queued:
+                    self._wakeup.wait()
+                job = self._next()
+                self._running[job.id] = job
+                self._running_per_owner[job.owner] += 1
+            self._set_status(job.id, 'running', started=time.time())
+            try:
+                result = self.run(job)
+                error = None
+            except Exception as e:
+                result = None
+                error = f'{type(e).__name__}: {e}'
+            if job.cancel.is_set():
+                status = 'cancelled'
+            else:
+                status = 'succeeded' if result is not None else 'failed'
+            self._set_status(job.id, status, result=result, error=error, finished=time.time())
+            with self._wakeup:
+                del self._running[job.id]
+                self._running_per_owner[job.owner] -= 1
+
+    def _set_status(self, job_id, status, result=None, error=None, started=None, finished=None):
+        with self._lock, self._connect() as conn:
+            if result is not None:
+                # update_result can get in first (work the job started may finish before the job
+                # returns), and what it wrote is newer than the job's own copy of those fields
+                row = conn.execute('SELECT result FROM jobs WHERE id = ?', (job_id,)).fetchone()
+                if row and row[0]:
+                    result = {**result, **json.loads(row[0])}
+            conn.execute(
+                'UPDATE jobs SET status = ?, result = COALESCE(?, result), error = COALESCE(?, error), '
+                'started = COALESCE(?, started), finished = COALESCE(?, finished) WHERE id = ?',
+                (status, json.dumps(result) if result is not None else None, error, started, finished, job_id)
+            )
+
+    def _append_event(self, job_id, kind, payload):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                'INSERT INTO events (job_id, seq, kind, payload) '
+                'SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ? FROM events WHERE job_id = ?',
+                (job_id, kind, json.dumps(payload), job_id)
+            )
+
+    def update_result(self, job_id, **fields):
+        # for work that outlives the job itself, e.g. a background high quality render
+        with self._lock, self._connect() as conn:
+            row = conn.execute('SELECT result FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return
+            result = json.loads(row[0]) if row[0] else {}
+            result.update(fields)
+            conn.execute('UPDATE jobs SET result = ? WHERE id = ?', (json.dumps(result), job_id))
+
+    def cancel(self, job_id):
+        with self._wakeup:
+            queued = self._dequeue(job_id)
+            job = self._running.get(job_id)
+        if queued:
+            # outside the lock: _set_status takes it
+            self._set_status(job_id, 'cancelled', finished=time.time())
+            return True
+        if job is None:
+            return False
+        # the job notices between stages; its status flips to cancelled once it returns
+        job.cancel.set()
+        return True
+
+    def _dequeue(self, job_id):
+        for owner, jobs in self._queued.items():
+            for job in jobs:
+                if job.id == job_id:
+                    jobs.remove(job)
+                    if not jobs:
+                        del self._queued[owner]
+                    return True
+        return False
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT id, owner, params, status, result, error, created, started, finished FROM jobs WHERE id = ?',
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(('id', 'owner', 'params', 'status', 'result', 'error', 'created', 'started', 'finished'), row))
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        with self._lock:
+            running = self._running.get(job_id)
+            job['progress'] = dict(running.progress) if running else {}
+            job['cancelling'] = bool(running and running.cancel.is_set())
+            job['position'] = self._position(job_id) if job['status'] == 'queued' else None
+        return job
+
+    def _position(self, job_id):
+        for position, job in enumerate(job for jobs in self._queued.values() for job in jobs):
+            if job.id == job_id:
+                return position
+        return None
+
+    def events(self, job_id, after=0):
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT seq, kind, payload FROM events WHERE job_id = ? AND seq > ? ORDER BY seq', (job_id, after)
+            ).fetchall()
+        return [(seq, kind, json.loads(payload)) for seq, kind, payload in rows]
+
+    def jobs_for(self, owner, limit=10):
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT id, status, params, created FROM jobs WHERE owner = ? ORDER BY created DESC LIMIT ?',
+                (owner, limit)
+            ).fetchall()
+        return [
+            {'id': job_id, 'status': status, 'params': json.loads(params), 'created': created}
+            for job_id, status, params, created in rows
+        ]
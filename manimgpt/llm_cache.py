@@ -0,0 +1,69 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from manimgpt.providers import ProviderResult
+
+DEFAULT_MAX_ENTRIES = 2000
+# responses above this are sampled, so replaying them would hide real variation
+MAX_CACHEABLE_TEMPERATURE = 0.1
+
+
+class ResponseCache:
+    def __init__(self, path='./llm-cache.sqlite', max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, response TEXT NOT NULL, last_access REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def key(self, provider, model_id, options, messages):
+        payload = json.dumps({
+            'provider': provider,
+            'model_id': model_id,
+            'options': options,
+            'messages': messages,
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock, self._connect() as conn:
+            row = conn.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (time.time(), key))
+            return row[0]
+
+    def put(self, key, response):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO responses (key, response, last_access) VALUES (?, ?, ?)',
+                (key, response, time.time())
+            )
+            conn.execute(
+                'DELETE FROM responses WHERE key IN ('
+                'SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def cached(self, provider, model_id, options, messages, fetch, bypass=False):
+        cacheable = options.get('temperature', 1) <= MAX_CACHEABLE_TEMPERATURE
+        key = self.key(provider, model_id, options, messages)
+        if cacheable and not bypass:
+            text = self.get(key)
+            if text is not None:
+                print(f'LLM cache hit: {key}')
+                return ProviderResult(text, None, cached=True)
+        result = fetch()
+        if cacheable and result.error is None:
+            self.put(key, result.text)
+        return result
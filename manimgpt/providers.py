@@ -0,0 +1,183 @@
+import asyncio
+import collections
+import concurrent.futures
+import os
+import random
+import threading
+import time
+
+import anthropic
+import httpx
+import ollama
+import openai
+
+from manimgpt.streaming import CodeBlockReader
+
+ProviderResult = collections.namedtuple('ProviderResult', ['text', 'error', 'cached'], defaults=[False])
+
+CONCURRENCY = {
+    'ollama': int(os.getenv('MANIMGPT_OLLAMA_CONCURRENCY', 1)),
+    'anthropic': int(os.getenv('MANIMGPT_ANTHROPIC_CONCURRENCY', 4)),
+    'openai': int(os.getenv('MANIMGPT_OPENAI_CONCURRENCY', 4)),
+}
+OLLAMA_KEEP_ALIVE = os.getenv('MANIMGPT_OLLAMA_KEEP_ALIVE', '30m')
+PRELOAD_INTERVAL = 5 * 60
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 30.0
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# one event loop thread owns every client, so connection pools and TLS sessions
+# survive across requests, Streamlit reruns and speculative candidates
+_loop = None
+_loop_lock = threading.Lock()
+_clients = {}
+_semaphores = {}
+_preloaded = {}
+
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='manimgpt-providers', daemon=True).start()
+        return _loop
+
+
+def _client(provider):
+    if provider not in _clients:
+        if provider == 'ollama':
+            _clients[provider] = ollama.AsyncClient(host=os.getenv('OLLAMA_HOST'))
+        elif provider == 'anthropic':
+            _clients[provider] = anthropic.AsyncAnthropic(
+                api_key=os.getenv('ANTHROPIC_API_KEY'), base_url=os.getenv('ANTHROPIC_BASE_URL'), max_retries=0
+            )
+        elif provider == 'openai':
+            _clients[provider] = openai.AsyncOpenAI(
+                api_key=os.getenv('OPENAI_API_KEY'), base_url=os.getenv('OPENAI_BASE_URL'), max_retries=0
+            )
+        else:
+            raise ValueError(f'Unknown provider: {provider}')
+    return _clients[provider]
+
+
+def _semaphore(provider):
+    if provider not in _semaphores:
+        _semaphores[provider] = asyncio.Semaphore(CONCURRENCY.get(provider, 1))
+    return _semaphores[provider]
+
+
+async def _stream_ollama(client, model_id, messages, options, reader):
+    stream = await client.chat(
+        model=model_id,
+        messages=messages,
+        stream=True,
+        options=options,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+    )
+    try:
+        async for chunk in stream:
+            if reader.feed(chunk['message']['content']):
+                break
+    finally:
+        await stream.aclose()
+
+
+async def _stream_anthropic(client, model_id, messages, options, reader):
+    system = '\n'.join(m['content'] for m in messages if m['role'] == 'system')
+    async with client.messages.stream(
+        model=model_id,
+        max_tokens=options.get('max_tokens', 1000),
+        temperature=options.get('temperature', 0),
+        system=system or anthropic.NOT_GIVEN,
+        messages=[m for m in messages if m['role'] != 'system'],
+    ) as stream:
+        async for text in stream.text_stream:
+            if reader.feed(text):
+                break
+
+
+async def _stream_openai(client, model_id, messages, options, reader):
+    stream = await client.chat.completions.create(
+        model=model_id,
+        messages=messages,
+        stream=True,
+        **options,
+    )
+    try:
+        async for chunk in stream:
+            if chunk.choices and reader.feed(chunk.choices[0].delta.content):
+                break
+    finally:
+        await stream.close()
+
+
+_STREAMERS = {
+    'ollama': _stream_ollama,
+    'anthropic': _stream_anthropic,
+    'openai': _stream_openai,
+}
+
+
+def _is_retryable(e):
+    if isinstance(e, (httpx.TransportError, anthropic.APIConnectionError, openai.APIConnectionError)):
+        return True
+    return getattr(e, 'status_code', None) in RETRY_STATUSES
+
+
+def _backoff_delay(attempt, e):
+    response = getattr(e, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    try:
+        return min(BACKOFF_CAP, float(retry_after))
+    except (TypeError, ValueError):
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+async def _complete(provider, model_id, messages, options, on_text):
+    if provider not in _STREAMERS:
+        return ProviderResult(None, f'ValueError: Unknown provider: {provider}')
+    for attempt in range(MAX_RETRIES + 1):
+        reader = CodeBlockReader(on_text)
+        try:
+            async with _semaphore(provider):
+                await _STREAMERS[provider](_client(provider), model_id, messages, options, reader)
+            return ProviderResult(reader.text, None)
+        except Exception as e:
+            if attempt == MAX_RETRIES or not _is_retryable(e):
+                print(f'Error getting {provider} response: {e}')
+                return ProviderResult(None, f'{type(e).__name__}: {e}')
+            delay = _backoff_delay(attempt, e)
+            print(f'{provider} request failed ({e}), retrying in {delay:.1f}s')
+            await asyncio.sleep(delay)
+
+
+def complete(provider, model_id, messages, options, on_text=None, cancel=None):
+    future = asyncio.run_coroutine_threadsafe(
+        _complete(provider, model_id, messages, options, on_text), _get_loop()
+    )
+    while True:
+        try:
+            return future.result(timeout=0.1)
+        except concurrent.futures.TimeoutError:
+            if cancel is not None and cancel.is_set():
+                # cancelling the task closes the HTTP stream, which stops generation server-side
+                future.cancel()
+                return ProviderResult(None, 'CancelledError: request cancelled')
+
+
+async def _preload(model_id):
+    try:
+        await _client('ollama').generate(model=model_id, keep_alive=OLLAMA_KEEP_ALIVE)
+    except Exception as e:
+        print(f'Error preloading {model_id}: {e}')
+
+
+def preload(model_id):
+    # an empty generate loads the weights, so the first real request doesn't pay for it
+    last = _preloaded.get(model_id)
+    if last is not None and time.time() - last < PRELOAD_INTERVAL:
+        return
+    _preloaded[model_id] = time.time()
+    asyncio.run_coroutine_threadsafe(_preload(model_id), _get_loop())
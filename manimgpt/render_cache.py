@@ -0,0 +1,126 @@
+import ast
+import hashlib
+import importlib.metadata
+import os
+import shutil
+import time
+import uuid
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+
+
+def manim_version():
+    try:
+        return importlib.metadata.version('manim')
+    except importlib.metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def normalize_code(code):
+    # ast.dump drops comments, whitespace and quoting style so cosmetic
+    # differences between two otherwise identical responses still hit
+    try:
+        return ast.dump(ast.parse(code))
+    except SyntaxError:
+        return code.strip()
+
+
+def _link_or_copy(source, target):
+    # the same mp4 usually also lives in the artifact store; a hard link keeps one copy on disk
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+class RenderCache:
+    def __init__(self, cache_dir='./render-cache', max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, code, class_name, quality='l'):
+        h = hashlib.sha256()
+        for part in (normalize_code(code), class_name or '', quality, manim_version()):
+            h.update(part.encode())
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def _path(self, key, ext):
+        return os.path.join(self.cache_dir, f'{key}.{ext}')
+
+    def get(self, key):
+        video_path = self._path(key, 'mp4')
+        error_path = self._path(key, 'err')
+        if os.path.exists(video_path):
+            os.utime(video_path)
+            return video_path, None
+        if os.path.exists(error_path):
+            os.utime(error_path)
+            with open(error_path) as f:
+                return None, f.read()
+        return None
+
+    def _write_atomic(self, path, write):
+        # a name per call, not per process: candidates and job threads can store the same key at once
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            self._remove(tmp_path)
+
+    def put_video(self, key, video_path):
+        path = self._path(key, 'mp4')
+        if os.path.exists(path) and os.path.samefile(video_path, path):
+            # another thread already stored this exact file under the key
+            return path
+        self._write_atomic(path, lambda tmp: _link_or_copy(video_path, tmp))
+        self.evict()
+        return path
+
+    def put_error(self, key, error):
+        path = self._path(key, 'err')
+
+        def write(tmp):
+            with open(tmp, 'w') as f:
+                f.write(error)
+        self._write_atomic(path, write)
+        self.evict()
+
+    def store(self, key, video_path, error):
+        if error:
+            # a dead worker says nothing about the code, and whether a scene fits the limits depends on
+            # the limits and the load at the time, so neither is pinned as a failure
+            if not error.startswith(('RenderWorkerError', 'SceneTooExpensiveError')):
+                self.put_error(key, error)
+            return None, error
+        return self.put_video(key, video_path), None
+
+    def evict(self):
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age:
+                self._remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
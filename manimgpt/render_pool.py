@@ -0,0 +1,398 @@
+import concurrent.futures
+import contextlib
+import errno
+import importlib.util
+import inspect
+import io
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
+import sys
+import threading
+import time
+import traceback
+import uuid
+
+try:
+    import resource
+except ImportError:
+    # no rlimits on Windows; the parent-side timeouts still apply
+    resource = None
+
+from manimgpt.scenes import concat_videos
+from manimgpt.validate import check_code
+
+QUALITIES = {
+    'l': 'low_quality',
+    'm': 'medium_quality',
+    'h': 'high_quality',
+    'p': 'production_quality',
+    'k': 'fourk_quality',
+}
+
+# rough cost of each quality relative to 480p15; render time and CPU limits scale with it
+QUALITY_COST = {'l': 1, 'm': 3, 'h': 8, 'p': 12, 'k': 30}
+
+DEFAULT_VALIDATE_TIMEOUT = 30
+DEFAULT_RENDER_TIMEOUT = int(os.getenv('MANIMGPT_RENDER_TIMEOUT', 300))
+DEFAULT_CPU_SECONDS = int(os.getenv('MANIMGPT_RENDER_CPU_SECONDS', 600))
+DEFAULT_MEMORY_MB = int(os.getenv('MANIMGPT_RENDER_MEMORY_MB', 4096))
+DEFAULT_MAX_OUTPUT_MB = int(os.getenv('MANIMGPT_RENDER_MAX_OUTPUT_MB', 512))
+# how long past its own deadline a job gets to raise before the parent kills the worker
+KILL_GRACE = 10
+MAX_PARTIAL_FILES = 1000
+DEFAULT_POOL_SIZE = int(os.getenv('MANIMGPT_RENDER_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+RENDERS_PER_CORE = float(os.getenv('MANIMGPT_RENDERS_PER_CORE', 1))
+TOO_EXPENSIVE_ADVICE = (
+    'Make the scene cheaper: fewer and shorter animations, no unbounded loops, fewer updaters '
+    'and mobjects, and lower resolution for surfaces.'
+)
+
+# every job in the process, across all pools, is admitted through this; cairo renders are CPU bound
+_admission = threading.BoundedSemaphore(max(1, int((os.cpu_count() or 1) * RENDERS_PER_CORE)))
+
+
+class SceneTooExpensive(Exception):
+    pass
+
+
+def too_expensive(reason):
+    # extract_error_info keeps the first "XError: ..." line, so the advice has to be on it
+    return f'SceneTooExpensiveError: {reason}. {TOO_EXPENSIVE_ADVICE}'
+
+
+def _init_worker(memory_mb=0, max_output_mb=0):
+    if hasattr(os, 'setpgrp'):
+        # own process group, so killing the worker also takes down latex/ffmpeg children
+        os.setpgrp()
+    if resource is not None:
+        if memory_mb:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_mb * 2 ** 20, memory_mb * 2 ** 20))
+        if max_output_mb:
+            resource.setrlimit(resource.RLIMIT_FSIZE, (max_output_mb * 2 ** 20, max_output_mb * 2 ** 20))
+            # an oversized write fails with EFBIG instead of killing the worker
+            signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+    # pay the manim + cairo/pango import once per worker instead of once per render
+    import manim  # noqa: F401
+
+
+@contextlib.contextmanager
+def _job_limits(timeout, cpu_seconds):
+    if resource is None:
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise SceneTooExpensive(f'rendering took longer than {timeout}s')
+
+    def on_cpu(signum, frame):
+        raise SceneTooExpensive(f'rendering used more than {cpu_seconds}s of CPU time')
+
+    signal.signal(signal.SIGALRM, on_alarm)
+    signal.signal(signal.SIGXCPU, on_cpu)
+    # workers are long-lived, so the CPU limit is set relative to what earlier jobs already used
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (int(usage.ru_utime + usage.ru_stime) + cpu_seconds, hard))
+    if timeout:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+
+def _job_error(output):
+    error = sys.exc_info()[1]
+    if isinstance(error, SceneTooExpensive):
+        return too_expensive(str(error))
+    if isinstance(error, MemoryError):
+        return too_expensive('rendering ran out of memory')
+    if isinstance(error, OSError) and error.errno == errno.EFBIG:
+        return too_expensive('the rendered output grew past the size limit')
+    return output.getvalue() + traceback.format_exc()
+
+
+def _ping():
+    return os.getpid()
+
+
+def _find_scene_class(module, class_name):
+    from manim import Scene
+    candidate = getattr(module, class_name, None) if class_name else None
+    if isinstance(candidate, type) and issubclass(candidate, Scene):
+        return candidate
+    # without a usable name, fall back to the first Scene subclass the script defines
+    for _, obj in inspect.getmembers(module, inspect.isclass):
+        if issubclass(obj, Scene) and obj.__module__ == module.__name__:
+            return obj
+    raise NameError(f'No Scene subclass named {class_name!r} found in script')
+
+
+def _load_module(script_path, module_name):
+    spec = importlib.util.spec_from_file_location(module_name, script_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def _render_job(script_path, class_name, quality, media_dir, partial_movie_dir=None, timeout=0, cpu_seconds=0):
+    from manim import tempconfig
+
+    # every job gets a fresh module so names from earlier scripts can't leak in
+    job_id = uuid.uuid4().hex
+    module_name = f'_manimgpt_scene_{job_id}'
+    output = io.StringIO()
+    overrides = {
+        'quality': QUALITIES[quality],
+        'media_dir': media_dir,
+        # a directory per job, so identical scripts rendering at once can't collide and the caller
+        # can delete the whole thing once it has taken the video out
+        'video_dir': os.path.join(media_dir, 'videos', job_id),
+        'input_file': script_path,
+        'preview': False,
+    }
+    if partial_movie_dir:
+        # manim hashes every play() call and skips the ones whose partial movie already exists,
+        # so a directory that outlives the per-attempt script/class names turns retries into
+        # re-rendering only the segments whose code (or preceding scene state) changed
+        overrides.update({
+            'partial_movie_dir': partial_movie_dir,
+            'disable_caching': False,
+            'max_files_cached': MAX_PARTIAL_FILES,
+        })
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output), _job_limits(timeout, cpu_seconds):
+            with tempconfig(overrides):
+                module = _load_module(script_path, module_name)
+                scene = _find_scene_class(module, class_name)()
+                started = time.time()
+                scene.render()
+                file_writer = scene.renderer.file_writer
+                segments = [path for path in file_writer.partial_movie_files if path]
+                reused = sum(1 for path in segments if os.path.getmtime(path) < started)
+                stats = {'segments': len(segments), 'reused_segments': reused}
+                return str(file_writer.movie_file_path), None, stats
+    except Exception:
+        return None, _job_error(output), {}
+    finally:
+        sys.modules.pop(module_name, None)
+
+
+def _preview_job(script_path, class_name, media_dir, timeout=0, cpu_seconds=0):
+    from manim import tempconfig
+
+    # the manim -s path: every play()/wait() is skipped and only the final frame is drawn
+    job_id = uuid.uuid4().hex
+    module_name = f'_manimgpt_scene_{job_id}'
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output), _job_limits(timeout, cpu_seconds):
+            with tempconfig({
+                'quality': QUALITIES['l'],
+                'save_last_frame': True,
+                'write_to_movie': False,
+                'disable_caching': True,
+                'media_dir': media_dir,
+                'images_dir': os.path.join(media_dir, 'images', job_id),
+                'input_file': script_path,
+                'preview': False,
+            }):
+                module = _load_module(script_path, module_name)
+                scene = _find_scene_class(module, class_name)()
+                scene.render()
+                return str(scene.renderer.file_writer.image_file_path), None
+    except Exception:
+        return None, _job_error(output)
+    finally:
+        sys.modules.pop(module_name, None)
+
+
+def _validate_job(script_path, class_name, media_dir, timeout=0, cpu_seconds=0):
+    import manim
+    from manim import tempconfig
+
+    with open(script_path) as f:
+        code = f.read()
+    namespace = getattr(manim, '__all__', None) or [name for name in dir(manim) if not name.startswith('_')]
+    error = check_code(code, namespace)
+    if error:
+        return error
+
+    module_name = f'_manimgpt_scene_{uuid.uuid4().hex}'
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output), _job_limits(timeout, cpu_seconds):
+            with tempconfig({
+                'dry_run': True,
+                'disable_caching': True,
+                'media_dir': media_dir,
+                'input_file': script_path,
+                'preview': False,
+            }):
+                module = _load_module(script_path, module_name)
+                scene = _find_scene_class(module, class_name)()
+                # jump every play()/wait() straight to its end state instead of rendering frames
+                scene.renderer.skip_animations = True
+                scene.renderer._original_skipping_status = True
+                scene.setup()
+                scene.construct()
+        return None
+    except Exception:
+        return _job_error(output)
+    finally:
+        sys.modules.pop(module_name, None)
+
+
+class RenderPool:
+    def __init__(self, size=DEFAULT_POOL_SIZE, media_dir='./media', partial_cache_dir='./partial-movie-cache',
+                 render_timeout=DEFAULT_RENDER_TIMEOUT, cpu_seconds=DEFAULT_CPU_SECONDS,
+                 memory_mb=DEFAULT_MEMORY_MB, max_output_mb=DEFAULT_MAX_OUTPUT_MB):
+        self.size = size
+        self.media_dir = os.path.abspath(media_dir)
+        self.partial_cache_dir = os.path.abspath(partial_cache_dir)
+        self.render_timeout = render_timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.max_output_mb = max_output_mb
+        self._lock = threading.Lock()
+        # one single-process executor per worker, so a stuck job can be killed and replaced without
+        # breaking the renders running next to it; a job only goes to an idle worker, so timeouts
+        # measure only the job itself
+        self._workers = [None] * size
+        self._idle = queue.Queue()
+        # partial movie dir -> lock; manim rewrites its concat list and segments in place, so two
+        # renders in one directory at once would read each other's half-written files
+        self._partial_locks = {}
+        for worker in range(size):
+            self._start(worker)
+            self._idle.put(worker)
+
+    def _start(self, worker):
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.memory_mb, self.max_output_mb),
+        )
+        # warm the worker up front so the first render doesn't pay the import
+        executor.submit(_ping)
+        self._workers[worker] = executor
+
+    def _restart(self, worker):
+        with self._lock:
+            executor = self._workers[worker]
+            for process in list((executor._processes or {}).values()):
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except (AttributeError, OSError):
+                    # no process groups on Windows, or the worker died before it made its own
+                    process.kill()
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._start(worker)
+
+    def _run(self, fn, timeout, cpu_seconds, *args):
+        worker = self._idle.get()
+        _admission.acquire()
+        try:
+            with self._lock:
+                future = self._workers[worker].submit(fn, *args, timeout, cpu_seconds)
+            # the job raises at its own deadline; this one only fires when a worker is stuck in C code and can't
+            return future.result(timeout=timeout + KILL_GRACE if timeout else None), None
+        except concurrent.futures.TimeoutError:
+            self._restart(worker)
+            return None, too_expensive(f'rendering took longer than {timeout}s and had to be killed')
+        except concurrent.futures.process.BrokenProcessPool as e:
+            # a scene took its worker down with it (segfault, OOM kill) -- replace just that worker
+            self._restart(worker)
+            return None, f'RenderWorkerError: render worker died: {e}'
+        finally:
+            # only handed out again once a replacement is in place
+            _admission.release()
+            self._idle.put(worker)
+
+    def _render_args(self, script_path, class_name, quality, scene_key):
+        # one directory per scene: manim writes its concat list and unfinished segments in place,
+        # so scenes of one script rendering in parallel must not share one
+        partial_movie_dir = os.path.join(self.partial_cache_dir, scene_key, class_name or 'scene') if scene_key else None
+        return os.path.abspath(script_path), class_name, quality, self.media_dir, partial_movie_dir
+
+    def _render_limits(self, quality):
+        return self.render_timeout * QUALITY_COST[quality], self.cpu_seconds * QUALITY_COST[quality]
+
+    def render(self, script_path, class_name=None, quality='l', scene_key=None, stats=None):
+        # scene_key names the job, not the attempt: retries that share it share partial movies
+        args = self._render_args(script_path, class_name, quality, scene_key)
+        with self._partial_lock(args[-1]):
+            result, error = self._run(_render_job, *self._render_limits(quality), *args)
+        if error:
+            return None, error
+        video_path, error, render_stats = result
+        if stats is not None:
+            stats.update(render_stats)
+        return video_path, error
+
+    def _partial_lock(self, partial_movie_dir):
+        if partial_movie_dir is None:
+            return contextlib.nullcontext()
+        with self._lock:
+            return self._partial_locks.setdefault(partial_movie_dir, threading.Lock())
+
+    def render_scenes(self, script_path, class_names, quality='l', scene_key=None, stats=None):
+        # one job per scene, in parallel, so a script takes as long as its slowest scene
+        if len(class_names) <= 1:
+            return self.render(script_path, class_names[0] if class_names else None, quality, scene_key, stats)
+        scene_stats = [{} for _ in class_names]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(class_names)) as executor:
+            results = list(executor.map(
+                lambda name, scene_stats: self.render(script_path, name, quality, scene_key, scene_stats),
+                class_names, scene_stats
+            ))
+        return self.stitch(results, scene_stats, stats)
+
+    def stitch(self, results, scene_stats=(), stats=None):
+        # results are the (video_path, error) of each scene, in order
+        video_paths = [video_path for video_path, _ in results if video_path]
+        try:
+            errors = [error for _, error in results if error]
+            if errors:
+                return None, errors[0]
+            output_dir = os.path.join(self.media_dir, 'videos', uuid.uuid4().hex)
+            os.makedirs(output_dir)
+            output_path = os.path.join(output_dir, 'scenes.mp4')
+            error = concat_videos(video_paths, output_path)
+            if error:
+                shutil.rmtree(output_dir, ignore_errors=True)
+                return None, error
+        finally:
+            # each clip had a job directory to itself and is only needed until it is stitched in
+            self.discard(video_paths)
+        if stats is not None:
+            stats['scenes'] = len(results)
+            for key in ('segments', 'reused_segments'):
+                stats[key] = sum(scene.get(key, 0) for scene in scene_stats)
+        return output_path, None
+
+    def discard(self, video_paths):
+        for video_path in video_paths:
+            shutil.rmtree(os.path.dirname(video_path), ignore_errors=True)
+
+    def preview(self, script_path, class_name=None, timeout=DEFAULT_VALIDATE_TIMEOUT):
+        result, error = self._run(_preview_job, timeout, self.cpu_seconds, os.path.abspath(script_path), class_name, self.media_dir)
+        return (None, error) if error else result
+
+    def validate(self, script_path, class_name=None, timeout=DEFAULT_VALIDATE_TIMEOUT):
+        # construct() with animations skipped should be quick; running long usually means an unbounded loop
+        result, error = self._run(_validate_job, timeout, self.cpu_seconds, os.path.abspath(script_path), class_name, self.media_dir)
+        return error or result
+
+    def shutdown(self):
+        with self._lock:
+            for executor in self._workers:
+                executor.shutdown(wait=False, cancel_futures=True)
+
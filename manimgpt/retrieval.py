@@ -0,0 +1,200 @@
+import argparse
+import array
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+import threading
+
+from manimgpt.history import count_tokens
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'docs')
+DEFAULT_INDEX_DIR = './retrieval-index'
+DEFAULT_TOP_K = 4
+DEFAULT_DOCS_BUDGET = 1500
+PROMPT_MODES = ('retrieval', 'static')
+# standard BM25 parameters
+K1 = 1.5
+B = 0.75
+
+WORD_PATTERN = re.compile(r'[A-Za-z0-9]+')
+CAMEL_PATTERN = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+')
+STOPWORDS = frozenset(
+    'a an and are as at be by can for from how in into is it its of on or so that the then this to use '
+    'using with you your explain show visualize animation animate math'.split()
+)
+
+
+def _normalize(word):
+    word = word.lower()
+    # crude plural folding so "circles" finds Circle
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    tokens = []
+    for word in WORD_PATTERN.findall(text):
+        parts = CAMEL_PATTERN.findall(word)
+        # index MathTex as mathtex, math and tex so both the API name and the concept match
+        for token in [word] + (parts if len(parts) > 1 else []):
+            token = _normalize(token)
+            if len(token) > 1 and token not in STOPWORDS:
+                tokens.append(token)
+    return tokens
+
+
+def load_snippets(docs_dir=DOCS_DIR):
+    snippets = []
+    for name in sorted(os.listdir(docs_dir)):
+        if not name.endswith('.md'):
+            continue
+        with open(os.path.join(docs_dir, name)) as f:
+            sections = re.split(r'^## ', f.read(), flags=re.M)[1:]
+        for section in sections:
+            title, _, body = section.partition('\n')
+            snippets.append({'title': title.strip(), 'text': body.strip(), 'source': name})
+    return snippets
+
+
+def corpus_hash(docs_dir=DOCS_DIR):
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(docs_dir)):
+        if name.endswith('.md'):
+            with open(os.path.join(docs_dir, name), 'rb') as f:
+                digest.update(name.encode() + b'\0' + f.read())
+    return digest.hexdigest()
+
+
+def build_index(index_dir=DEFAULT_INDEX_DIR, docs_dir=DOCS_DIR):
+    snippets = load_snippets(docs_dir)
+    postings = {}
+    doc_lengths = []
+    for doc_id, snippet in enumerate(snippets):
+        # the title is the best summary of a snippet, so it counts twice
+        tokens = tokenize(f'{snippet["title"]} {snippet["title"]} {snippet["text"]}')
+        doc_lengths.append(len(tokens))
+        for token in tokens:
+            counts = postings.setdefault(token, {})
+            counts[doc_id] = counts.get(doc_id, 0) + 1
+
+    # postings.bin: (doc id, term frequency) uint32 pairs grouped by term
+    # snippets.bin: the snippet texts back to back, sliced by byte offset
+    pairs = array.array('I')
+    terms = {}
+    for token in sorted(postings):
+        terms[token] = [len(pairs) // 2, len(postings[token])]
+        for doc_id, tf in sorted(postings[token].items()):
+            pairs.extend((doc_id, tf))
+    texts = bytearray()
+    offsets = []
+    for snippet in snippets:
+        data = f'{snippet["title"]}\n{snippet["text"]}'.encode()
+        offsets.append([len(texts), len(texts) + len(data)])
+        texts.extend(data)
+    header = {
+        'corpus_sha256': corpus_hash(docs_dir),
+        'avgdl': sum(doc_lengths) / len(doc_lengths),
+        'doc_lengths': doc_lengths,
+        'offsets': offsets,
+        'terms': terms,
+    }
+
+    os.makedirs(index_dir, exist_ok=True)
+    # header goes last: a half-written index has a stale or missing header and gets rebuilt
+    for name, data in (('postings.bin', pairs.tobytes()), ('snippets.bin', bytes(texts)), ('header.json', json.dumps(header).encode())):
+        path = os.path.join(index_dir, name)
+        with open(f'{path}.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(f'{path}.tmp', path)
+    return len(snippets)
+
+
+class SnippetIndex:
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR):
+        with open(os.path.join(index_dir, 'header.json')) as f:
+            header = json.load(f)
+        self.corpus_sha256 = header['corpus_sha256']
+        self.avgdl = header['avgdl']
+        self.doc_lengths = header['doc_lengths']
+        self.offsets = header['offsets']
+        self.terms = header['terms']
+        self._files = [open(os.path.join(index_dir, name), 'rb') for name in ('postings.bin', 'snippets.bin')]
+        self._maps = [mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) for f in self._files]
+        self.postings = memoryview(self._maps[0]).cast('I')
+        self.texts = self._maps[1]
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def snippet(self, doc_id):
+        start, end = self.offsets[doc_id]
+        return self.texts[start:end].decode()
+
+    def search(self, query, k=DEFAULT_TOP_K):
+        scores = {}
+        for token in set(tokenize(query)):
+            if token not in self.terms:
+                continue
+            start, count = self.terms[token]
+            idf = math.log(1 + (len(self) - count + 0.5) / (count + 0.5))
+            for i in range(start, start + count):
+                doc_id, tf = self.postings[2 * i], self.postings[2 * i + 1]
+                norm = K1 * (1 - B + B * self.doc_lengths[doc_id] / self.avgdl)
+                scores[doc_id] = scores.get(doc_id, 0) + idf * tf * (K1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: -item[1])[:k]
+        return [(score, doc_id) for doc_id, score in ranked]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def load_index(index_dir=DEFAULT_INDEX_DIR, docs_dir=DOCS_DIR):
+    # built on first use and whenever the docs change; after that startup is just an mmap
+    global _index
+    with _index_lock:
+        if _index is None:
+            try:
+                _index = SnippetIndex(index_dir)
+            except (OSError, ValueError, KeyError):
+                _index = None
+            if _index is None or _index.corpus_sha256 != corpus_hash(docs_dir):
+                build_index(index_dir, docs_dir)
+                _index = SnippetIndex(index_dir)
+        return _index
+
+
+def assemble_system_message(base_message, user_prompt, index, docs_budget=DEFAULT_DOCS_BUDGET, k=DEFAULT_TOP_K, count_tokens=count_tokens):
+    sections = []
+    used = 0
+    doc_ids = [doc_id for _, doc_id in index.search(user_prompt, k)]
+    # prompts with no overlap with the docs ("explain backpropagation") still get the basics, in corpus order
+    doc_ids += [doc_id for doc_id in range(len(index)) if doc_id not in doc_ids][:k - len(doc_ids)]
+    for doc_id in doc_ids:
+        snippet = index.snippet(doc_id)
+        tokens = count_tokens(snippet)
+        # skip rather than stop: a shorter, lower ranked snippet may still fit
+        if used + tokens > docs_budget:
+            continue
+        sections.append(f'### {snippet}')
+        used += tokens
+    if not sections:
+        return base_message
+    return base_message.rstrip() + '\n\nmanim documentation relevant to this request:\n\n' + '\n\n'.join(sections) + '\n'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the manim docs index and show what a prompt retrieves.')
+    parser.add_argument('query', nargs='?', help='prompt to retrieve snippets for')
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR)
+    parser.add_argument('-k', type=int, default=DEFAULT_TOP_K)
+    args = parser.parse_args()
+    print(f'Indexed {build_index(args.index_dir)} snippets into {args.index_dir}')
+    if args.query:
+        index = SnippetIndex(args.index_dir)
+        for score, doc_id in index.search(args.query, args.k):
+            print(f'{score:.2f}  {index.snippet(doc_id).splitlines()[0]}')
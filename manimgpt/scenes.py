@@ -0,0 +1,115 @@
+import ast
+import os
+import re
+import subprocess
+
+CODE_BLOCK_PATTERN = re.compile(r'```[ \t]*([\w+-]*)[^\n]*\n([\s\S]*?)```')
+PYTHON_TAGS = ('', 'python', 'py', 'python3')
+SCENE_BASES = frozenset((
+    'Scene', 'ThreeDScene', 'MovingCameraScene', 'ZoomedScene', 'VectorScene', 'LinearTransformationScene',
+))
+FFMPEG = os.getenv('MANIMGPT_FFMPEG', 'ffmpeg')
+CONCAT_TIMEOUT = 120
+
+
+def _statement_key(node):
+    # a class or function defined twice is the model revising it; anything else only merges if identical
+    if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+        return 'def', node.name
+    return 'stmt', ast.dump(node)
+
+
+def _defines_something(tree):
+    # skips fragments like a lone `self.play(...)` the model quotes while explaining a change
+    return any(
+        isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef, ast.Import, ast.ImportFrom))
+        for node in tree.body
+    )
+
+
+def extract_code(model_response):
+    blocks = []
+    first_valid = None
+    for tag, block in CODE_BLOCK_PATTERN.findall(model_response):
+        if tag.lower() not in PYTHON_TAGS:
+            continue
+        block = block.strip()
+        try:
+            tree = ast.parse(block)
+        except SyntaxError:
+            continue
+        first_valid = first_valid or block
+        if _defines_something(tree):
+            blocks.append((block, tree))
+    if len(blocks) <= 1:
+        return blocks[0][0] if blocks else first_valid
+
+    statements = []
+    positions = {}
+    for block, tree in blocks:
+        lines = block.splitlines()
+        previous_end = 0
+        for node in tree.body:
+            # each statement keeps the comment lines above it
+            source = '\n'.join(lines[previous_end:node.end_lineno]).strip('\n')
+            previous_end = node.end_lineno
+            key = _statement_key(node)
+            if key in positions:
+                # a revised class stays where it was first defined, so subclasses still come after it
+                statements[positions[key]] = source
+            else:
+                positions[key] = len(statements)
+                statements.append(source)
+    return '\n\n'.join(statements) + '\n'
+
+
+def _base_name(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+def scene_classes(code):
+    # a base has to be defined before a subclass can use it, so source order is already dependency order
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+    scenes = {}
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        bases = {_base_name(base) for base in node.bases}
+        if bases & SCENE_BASES or bases & scenes.keys():
+            has_construct = any(
+                isinstance(item, ast.FunctionDef) and item.name == 'construct' for item in node.body
+            )
+            scenes[node.name] = (has_construct, bases)
+    # scenes other scenes extend are templates (shared setup, axes, colours), not parts of the video
+    templates = set().union(*(bases for _, bases in scenes.values())) if scenes else set()
+    return [name for name, (has_construct, _) in scenes.items() if has_construct and name not in templates]
+
+
+def concat_videos(video_paths, output_path, ffmpeg=FFMPEG):
+    # every clip comes out of the same renderer at the same quality and frame rate, so the
+    # streams line up and can be copied into one file without re-encoding
+    list_path = f'{output_path}.txt'
+    with open(list_path, 'w') as f:
+        for path in video_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    try:
+        result = subprocess.run(
+            [ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_path,
+             '-c', 'copy', '-movflags', '+faststart', output_path],
+            capture_output=True, text=True, timeout=CONCAT_TIMEOUT
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return f'RenderWorkerError: could not concatenate scenes with {ffmpeg}: {e}'
+    finally:
+        os.remove(list_path)
+    if result.returncode != 0:
+        return f'RenderWorkerError: concatenating scenes failed: {result.stderr.strip()}'
+    return None
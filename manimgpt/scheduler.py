@@ -0,0 +1,159 @@
+import concurrent.futures
+import itertools
+import threading
+
+# lower runs first: anything the user is waiting on beats background high-quality renders
+VALIDATE = 0
+PREVIEW = 1
+LOW_QUALITY = 2
+HIGH_QUALITY = 3
+# how often a caller blocked on renders checks whether it has been cancelled
+CANCEL_POLL_SECONDS = 0.2
+
+
+class RenderScheduler:
+    def __init__(self, render_pool, background_slots=None):
+        self.render_pool = render_pool
+        # keep at least one worker free of background renders so new prompts never queue behind them
+        self.background_slots = background_slots or max(1, render_pool.size - 1)
+        self._queue = []
+        self._sequence = itertools.count()
+        self._background_running = 0
+        self._cond = threading.Condition()
+        for i in range(render_pool.size):
+            threading.Thread(target=self._work, name=f'render-scheduler-{i}', daemon=True).start()
+
+    def submit(self, tier, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+        with self._cond:
+            self._queue.append((tier, next(self._sequence), future, fn, args, kwargs))
+            self._cond.notify()
+        return future
+
+    def _eligible(self, tier):
+        return tier < HIGH_QUALITY or self._background_running < self.background_slots
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                jobs = sorted((job for job in self._queue if self._eligible(job[0])), key=lambda job: job[:2])
+                if jobs:
+                    job = jobs[0]
+                    self._queue.remove(job)
+                    if job[0] == HIGH_QUALITY:
+                        self._background_running += 1
+                    return job
+                self._cond.wait()
+
+    def _work(self):
+        while True:
+            tier, _, future, fn, args, kwargs = self._next_job()
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except Exception as e:
+                        future.set_exception(e)
+            finally:
+                if tier == HIGH_QUALITY:
+                    with self._cond:
+                        self._background_running -= 1
+                        self._cond.notify_all()
+
+    def cancel(self, future):
+        # a queued job just leaves the queue; one that already started runs to completion and
+        # whatever it wrote is thrown away
+        if not future.cancel():
+            future.add_done_callback(self._discard_output)
+
+    def _discard_output(self, future):
+        if future.exception() is not None:
+            return
+        result = future.result()
+        # previews and renders return (path, error); validation writes nothing worth keeping
+        if isinstance(result, tuple) and result[0]:
+            self.render_pool.discard([result[0]])
+
+    def wait(self, futures, cancel=None, poll=CANCEL_POLL_SECONDS):
+        # the results in order, or None if cancel was set first, in which case every future
+        # still outstanding is cancelled
+        while True:
+            _, pending = concurrent.futures.wait(futures, timeout=poll)
+            if not pending:
+                return [future.result() for future in futures]
+            if cancel is not None and cancel.is_set():
+                for future in pending:
+                    self.cancel(future)
+                return None
+
+    def validate(self, script_path, class_name=None):
+        return self.submit(VALIDATE, self.render_pool.validate, script_path, class_name)
+
+    def preview(self, script_path, class_name=None):
+        return self.submit(PREVIEW, self.render_pool.preview, script_path, class_name)
+
+    def render(self, script_path, class_name=None, quality='l', scene_key=None, stats=None):
+        tier = LOW_QUALITY if quality == 'l' else HIGH_QUALITY
+        return self.submit(tier, self.render_pool.render, script_path, class_name, quality, scene_key, stats)
+
+    def render_scenes(self, script_path, class_names, quality='l', scene_key=None, stats=None):
+        if len(class_names) <= 1:
+            return self.render(script_path, class_names[0] if class_names else None, quality, scene_key, stats)
+        # every scene queues as a render of its own, so they spread over the workers at the same
+        # priority (and high quality ones still leave a worker free) instead of nesting in one job
+        scene_stats = [{} for _ in class_names]
+        scenes = [
+            self.render(script_path, name, quality, scene_key, scene)
+            for name, scene in zip(class_names, scene_stats)
+        ]
+        future = concurrent.futures.Future()
+        future.add_done_callback(lambda future: future.cancelled() and [scene.cancel() for scene in scenes])
+
+        def stitch():
+            results = []
+            for scene in scenes:
+                try:
+                    results.append(scene.result())
+                except concurrent.futures.CancelledError:
+                    results.append((None, 'RenderWorkerError: render cancelled'))
+                except Exception as e:
+                    results.append((None, f'RenderWorkerError: {type(e).__name__}: {e}'))
+            if not future.set_running_or_notify_cancel():
+                self.render_pool.discard([video_path for video_path, _ in results if video_path])
+                return
+            try:
+                future.set_result(self.render_pool.stitch(results, scene_stats, stats))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=stitch, name='render-scheduler-stitch', daemon=True).start()
+        return future
+
+
+class _Chained(concurrent.futures.Future):
+    def __init__(self, source):
+        super().__init__()
+        self._source = source
+
+    def cancel(self):
+        # only while the original hasn't started; once it has, its result is still wanted
+        return self._source.cancel() and super().cancel()
+
+
+def chain(future, fn):
+    # a future of fn(future.result()); it can be cancelled only as long as the original can
+    chained = _Chained(future)
+
+    def resolve(future):
+        if future.cancelled():
+            chained.cancel()
+            return
+        if not chained.set_running_or_notify_cancel():
+            return
+        try:
+            chained.set_result(fn(future.result()))
+        except Exception as e:
+            chained.set_exception(e)
+
+    future.add_done_callback(resolve)
+    return chained
@@ -0,0 +1,62 @@
+import concurrent.futures
+import queue
+import threading
+
+# candidates past the first are sampled so N runs of one model don't all return the same code
+SPECULATIVE_TEMPERATURE = 0.7
+
+
+def plan_candidates(model_ids, count):
+    candidates = []
+    for i in range(count):
+        # the first pass over the models stays deterministic (and cacheable)
+        temperature = 0 if i < len(model_ids) else SPECULATIVE_TEMPERATURE
+        candidates.append((model_ids[i % len(model_ids)], temperature))
+    return candidates
+
+
+def race(candidates, attempt, on_event, poll_interval=0.1, stop=None):
+    # attempt(candidate, cancel, report) runs in its own thread and returns a result on success
+    # or None on failure; report(kind, payload) queues UI events, which on_event(index, kind, payload)
+    # receives on the calling thread. Returns (index, result) for the first success, or None.
+    # Setting stop (a threading.Event) cancels every candidate.
+    cancel = threading.Event()
+    events = queue.Queue()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(candidates))
+    futures = {}
+    for i, candidate in enumerate(candidates):
+        report = lambda kind, payload, i=i: events.put((i, kind, payload))
+        futures[executor.submit(attempt, candidate, cancel, report)] = i
+
+    def drain():
+        while True:
+            try:
+                on_event(*events.get_nowait())
+            except queue.Empty:
+                return
+
+    winner = None
+    pending = set(futures)
+    try:
+        while pending and winner is None and not (stop and stop.is_set()):
+            done, pending = concurrent.futures.wait(
+                pending, timeout=poll_interval, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            drain()
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    on_event(futures[future], 'failed', f'{type(e).__name__}: {e}')
+                    continue
+                if result is not None:
+                    winner = (futures[future], result)
+                    break
+                on_event(futures[future], 'failed', None)
+    finally:
+        # losers see the flag between stages; queued work is dropped outright
+        cancel.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    if winner is not None:
+        drain()
+    return winner
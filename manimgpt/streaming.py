@@ -0,0 +1,25 @@
+# how much prose may follow the last closed code block before no more code is expected; responses
+# that split a scene over several blocks usually explain each one in a sentence or two in between
+TRAILING_PROSE_CHARS = 400
+
+
+class CodeBlockReader:
+    def __init__(self, on_text=None):
+        self.on_text = on_text
+        self.text = ''
+
+    def feed(self, chunk):
+        if not chunk:
+            return False
+        self.text += chunk
+        if self.on_text:
+            self.on_text(self.text)
+        fences = self.text.count('```')
+        if fences >= 2 and fences % 2 == 0:
+            end = self.text.rindex('```') + 3
+            if len(self.text) - end > TRAILING_PROSE_CHARS:
+                # every code block gets merged, so keep reading until the tail is only prose,
+                # then stop paying for the rest of it
+                self.text = self.text[:end]
+                return True
+        return False
@@ -0,0 +1,137 @@
+import collections
+import contextlib
+import http.server
+import json
+import threading
+import time
+import uuid
+
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# numeric span attributes that are also summed into Prometheus counters
+COUNTED_ATTRS = ('prompt_tokens', 'completion_tokens', 'bytes_written')
+
+
+class Trace:
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.timings = {}
+        self._stack = []
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        span = {
+            'trace_id': self.trace_id,
+            'span_id': uuid.uuid4().hex[:16],
+            'parent_id': self._stack[-1] if self._stack else None,
+            'trace': self.name,
+            'name': name,
+            'start': time.time(),
+            'attrs': dict(self.attrs, **attrs),
+        }
+        self._stack.append(span['span_id'])
+        start = time.perf_counter()
+        try:
+            yield span['attrs']
+        except BaseException as e:
+            span['attrs']['error'] = type(e).__name__
+            raise
+        finally:
+            span['duration'] = time.perf_counter() - start
+            self._stack.pop()
+            self.timings[name] = self.timings.get(name, 0) + span['duration']
+            self.tracer.record(span)
+
+
+class Tracer:
+    def __init__(self, jsonl_path=None, max_spans=5000):
+        self.jsonl_path = jsonl_path
+        self.spans = collections.deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = collections.Counter()
+        self._errors = collections.Counter()
+
+    def trace(self, name, **attrs):
+        return Trace(self, name, attrs)
+
+    def record(self, span):
+        labels = (span['name'], str(span['attrs'].get('model', '')))
+        with self._lock:
+            self.spans.append(span)
+            histogram = self._histograms.setdefault(labels, {'buckets': [0] * len(DURATION_BUCKETS), 'sum': 0, 'count': 0})
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if span['duration'] <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += span['duration']
+            histogram['count'] += 1
+            for attr in COUNTED_ATTRS:
+                value = span['attrs'].get(attr)
+                if isinstance(value, (int, float)):
+                    self._counters[(attr, span['name'])] += value
+            if span['attrs'].get('error'):
+                self._errors[span['name']] += 1
+            if self.jsonl_path:
+                with open(self.jsonl_path, 'a') as f:
+                    f.write(json.dumps(span, default=str) + '\n')
+
+    def spans_for(self, trace_ids):
+        with self._lock:
+            return [span for span in self.spans if span['trace_id'] in trace_ids]
+
+    def to_jsonl(self):
+        with self._lock:
+            return ''.join(json.dumps(span, default=str) + '\n' for span in self.spans)
+
+    def prometheus_text(self):
+        lines = [
+            '# HELP manimgpt_stage_duration_seconds Time spent in each pipeline stage.',
+            '# TYPE manimgpt_stage_duration_seconds histogram',
+        ]
+        with self._lock:
+            for (stage, model), histogram in sorted(self._histograms.items()):
+                labels = f'stage="{stage}",model="{model}"'
+                for bound, count in zip(DURATION_BUCKETS, histogram['buckets']):
+                    lines.append(f'manimgpt_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'manimgpt_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+                lines.append(f'manimgpt_stage_duration_seconds_sum{{{labels}}} {histogram["sum"]}')
+                lines.append(f'manimgpt_stage_duration_seconds_count{{{labels}}} {histogram["count"]}')
+            for attr in COUNTED_ATTRS:
+                lines.append(f'# TYPE manimgpt_{attr}_total counter')
+                for (name, stage), value in sorted(self._counters.items()):
+                    if name == attr:
+                        lines.append(f'manimgpt_{attr}_total{{stage="{stage}"}} {value}')
+            lines.append('# TYPE manimgpt_stage_errors_total counter')
+            for stage, value in sorted(self._errors.items()):
+                lines.append(f'manimgpt_stage_errors_total{{stage="{stage}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            body, content_type = self.server.tracer.prometheus_text(), 'text/plain; version=0.0.4'
+        elif self.path == '/spans':
+            body, content_type = self.server.tracer.to_jsonl(), 'application/x-ndjson'
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve_metrics(tracer, port, host='127.0.0.1'):
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server.tracer = tracer
+    threading.Thread(target=server.serve_forever, name='manimgpt-metrics', daemon=True).start()
+    return server
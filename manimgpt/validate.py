@@ -0,0 +1,60 @@
+import ast
+import builtins
+
+from manimgpt.scenes import scene_classes
+
+MODULE_GLOBALS = {'__name__', '__file__', '__doc__', '__builtins__', '__spec__', '__loader__', '__package__'}
+
+
+def _bound_names(tree):
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name != '*':
+                    names.add(alias.asname or alias.name.split('.')[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            names.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            names.add(node.rest)
+    return names
+
+
+def undefined_names(tree, manim_namespace):
+    star_modules = {
+        node.module for node in ast.walk(tree)
+        if isinstance(node, ast.ImportFrom) and any(alias.name == '*' for alias in node.names)
+    }
+    # we can only vouch for what `from manim import *` brings in
+    if star_modules - {'manim'}:
+        return []
+    available = _bound_names(tree) | set(dir(builtins)) | MODULE_GLOBALS
+    if 'manim' in star_modules:
+        available |= set(manim_namespace)
+    missing = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in available:
+            missing.setdefault(node.id, node.lineno)
+    return sorted(missing.items(), key=lambda item: item[1])
+
+
+def check_code(code, manim_namespace):
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return f'SyntaxError: {e.msg} (line {e.lineno})'
+    # same rule the renderer uses to pick classes, so a script that passes here has something to render
+    if not scene_classes(code):
+        return 'TypeError: no Scene subclass with a construct() method was found'
+    missing = undefined_names(tree, manim_namespace)
+    if missing:
+        return 'NameError: ' + '; '.join(f"name '{name}' is not defined (line {line})" for name, line in missing)
+    return None
@@ -1,89 +1,184 @@
-import ollama
-import re
+import argparse
+import shutil
 import os
-import subprocess
-import uuid
-import ast
 
+from manimgpt import providers
+from manimgpt.artifacts import ArtifactStore
+from manimgpt.batch import job_id, load_jobs, run_batch
+from manimgpt.errors import extract_error_info
+from manimgpt.fixes import MAX_REPAIRS, FixIndex, FixLearner, repair
+from manimgpt.history import DEFAULT_TOKEN_BUDGET, ConversationHistory, budget_for_context, count_tokens
+from manimgpt.llm_cache import ResponseCache
+from manimgpt.render_cache import RenderCache
+from manimgpt.render_pool import RenderPool
+from manimgpt.retrieval import PROMPT_MODES, assemble_system_message, load_index
+from manimgpt.scenes import extract_code, scene_classes
+from manimgpt.tracing import Tracer
 
+
+model_to_context = {
+    'llama3': 8192,
+    'deepseek-coder-v2': 16384,
+}
 # model_id = 'llama3'
-# num_ctx = 8192
 model_id = 'deepseek-coder-v2'
-num_ctx = 16384
+temperature = 0.05
+retry_count = 5
+render_workers = int(os.getenv('MANIMGPT_RENDER_WORKERS', 1))
+token_budget = int(os.getenv('MANIMGPT_TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET))
+bypass_llm_cache = os.getenv('MANIMGPT_BYPASS_LLM_CACHE', '') not in ('', '0')
+# 'retrieval' appends the docs snippets that match each prompt, 'static' sends the system message as-is
+prompt_mode = os.getenv('MANIMGPT_PROMPT_MODE', 'retrieval')
 
-def get_response(messages):
-    try:
-        response = ollama.chat(
-            model=model_id,
-            messages=messages,
-            stream=False,
-            options={
-                'temperature': 0.05,
-                'num_ctx': num_ctx,
-            }
-        )
-        return response['message']['content']
-    except Exception as e:
-        print(f'Error getting Ollama response: {e}')
-        exit(-1)
+def get_options(model_id):
+    return {
+        'temperature': temperature,
+        'num_ctx': model_to_context[model_id],
+    }
 
-def write_python_to_file(python_content):
+def get_response(llm_cache, model_id, messages):
+    options = get_options(model_id)
+    return llm_cache.cached(
+        'ollama', model_id, options, messages,
+        lambda: providers.complete('ollama', model_id, messages, options),
+        bypass=bypass_llm_cache
+    )
+
+def write_python_to_file(artifacts, python_content, meta):
     try:
-        filename = str(uuid.uuid4())
-        with open(f'./test-scripts/{filename}.py', 'w+') as f:
-            f.write(python_content)
-        return filename
+        return artifacts.put_text('script', python_content, **meta)[1]
     except Exception as e:
         print(f'Error writing to python file: {e}')
         exit(-1)
 
+def store_render_output(artifacts, kind, path, meta):
+    key, stored_path = artifacts.put_file(kind, path, move=True, **meta)
+    # the worker gave this job its own directory; nothing else in it is worth keeping
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+    return key, stored_path
+
 def parse_python(model_response):
     try:
-        os.makedirs('./test-scripts', exist_ok=True)
         print(model_response)
-        python_match = re.search(r'```(?:python)?([\s\S]*?)```', model_response)
-        if python_match:
-            python_code = python_match.group(1).strip()
-            if not is_valid_python_code(python_code):
-                print('Invalid Python code')
-                return None
-            filename = write_python_to_file(python_match.group(1).strip())
-            return python_code, filename
-        else:
+        # all the python blocks in the response, merged, so scenes split across blocks all render
+        python_code = extract_code(model_response)
+        if not python_code:
             print('NO PYTHON MATCH!')
-            exit(-1)
+        return python_code
     except Exception as e:
         print(f'Error parsing python file: {e}')
-        exit(-1)
-
-def run_python_file(filename):
-    try:
-        subprocess.check_output(
-            ['manim', '-pql', f'./test-scripts/{filename}.py', filename],
-            stderr=subprocess.STDOUT,
-            text=True
-        )
         return None
-    except subprocess.CalledProcessError as e:
-        return e.output
 
-def is_valid_python_code(code):
-    try:
-        ast.parse(code)
-        return True
-    except SyntaxError as e:
-        print(f"SyntaxError: {e}")
-        return False
+def run_python_file(render_pool, render_cache, artifacts, script_path, python_code, meta, trace, attempt, scene_key):
+    class_names = scene_classes(python_code)
+    with trace.span('render_cache', attempt=attempt) as span:
+        key = render_cache.key(python_code, ','.join(class_names))
+        cached = render_cache.get(key)
+        span['hit'] = cached is not None
+    if cached:
+        print(f'Render cache hit: {key}')
+        video_path, error = cached
+        if error:
+            return None, error
+        return artifacts.put_file('video', video_path, **meta)[0], None
+    with trace.span('validate', attempt=attempt) as span:
+        for class_name in class_names or [None]:
+            error = render_pool.validate(script_path, class_name)
+            if error:
+                break
+        span['failed'] = bool(error)
+    if error:
+        print('Validation failed, skipping render')
+        artifacts.put_text('log', error, **meta)
+        return render_cache.store(key, None, error)
+    with trace.span('render', attempt=attempt) as span:
+        video_path, error = render_pool.render_scenes(script_path, class_names, scene_key=scene_key, stats=span)
+        span['failed'] = bool(error)
+        if video_path:
+            span['bytes_written'] = os.path.getsize(video_path)
+    if scene_key:
+        artifacts.track_dir('partial', os.path.join(render_pool.partial_cache_dir, scene_key), **meta)
+    if error:
+        artifacts.put_text('log', error, **meta)
+        return render_cache.store(key, None, error)
+    video_key, video_path = store_render_output(artifacts, 'video', video_path, meta)
+    render_cache.store(key, video_path, None)
+    return video_key, None
 
-def create_message(role, content):
+def run_job(job, system_message, llm_cache, render_pool, render_cache, artifacts, fix_index, tracer):
+    job_model_id = job.get('model', model_id)
+    if prompt_mode == 'retrieval':
+        system_message = assemble_system_message(system_message, job['prompt'], load_index())
+    history = ConversationHistory(
+        system_message, job['prompt'], budget_for_context(model_to_context[job_model_id], token_budget)
+    )
+    trace = tracer.trace(job.get('id', 'one-off'), model=job_model_id, prompt_mode=prompt_mode)
+    learner = FixLearner(fix_index)
+    timings = trace.timings
+    python_code = None
+    error = None
+    system_tokens = count_tokens(system_message)
+    for attempt in range(1, retry_count + 1):
+        messages = history.messages()
+        prompt_tokens = history.total_tokens(messages)
+        print(f'Prompt tokens: {prompt_tokens}')
+        with trace.span('llm', attempt=attempt, prompt_tokens=prompt_tokens) as span:
+            result = get_response(llm_cache, job_model_id, messages)
+            span['cached'] = result.cached
+            if result.text:
+                span['completion_tokens'] = count_tokens(result.text)
+        if result.error:
+            print(f'Error getting Ollama response: {result.error}')
+            error = result.error
+            break
+        meta = {'prompt': job['prompt'], 'model': job_model_id, 'attempt': attempt}
+        with trace.span('parse', attempt=attempt) as span:
+            parsed = parse_python(result.text)
+            if parsed:
+                span['bytes_written'] = len(parsed.encode())
+                script_path = write_python_to_file(artifacts, parsed, meta)
+        if not parsed:
+            error = 'No Python code in response'
+            history.add_attempt(result.text, None, None)
+            continue
+        python_code = parsed
+        video_key, error = run_python_file(render_pool, render_cache, artifacts, script_path, python_code, meta, trace, attempt, job_id(job))
+        learner.observe(python_code, error)
+        model_response = result.text
+        for _ in range(MAX_REPAIRS):
+            if not error:
+                break
+            with trace.span('repair', attempt=attempt) as span:
+                repaired, rules = repair(python_code, error)
+                span['rules'] = rules
+            if not repaired:
+                break
+            print(error)
+            print(f'Auto-repairing: {", ".join(rules)}')
+            python_code = repaired
+            model_response = f'```python\n{python_code}\n```'
+            script_path = write_python_to_file(artifacts, python_code, meta)
+            video_key, error = run_python_file(render_pool, render_cache, artifacts, script_path, python_code, meta, trace, attempt, job_id(job))
+            learner.observe(python_code, error)
+        if error:
+            print(error)
+            history.add_attempt(model_response, python_code, error, fix_index.hint(error))
+            continue
+        return {
+            'model': job_model_id, 'status': 'succeeded', 'code': python_code,
+            'video_key': video_key, 'video_path': artifacts.get(video_key),
+            'attempts': attempt, 'timings': timings, 'error': None,
+            'prompt_mode': prompt_mode, 'system_tokens': system_tokens,
+        }
     return {
-        'role': role,
-        'content': content
+        'model': job_model_id, 'status': 'failed', 'code': python_code, 'video_key': None, 'video_path': None,
+        'attempts': attempt, 'timings': timings, 'error': extract_error_info(error) if error else None,
+        'prompt_mode': prompt_mode, 'system_tokens': system_tokens,
     }
 
 
 if __name__ == '__main__':
-    system_message = '''
+    quickstart = '''
     ---
     Text below is from the manim quickstart guide:
     This quickstart guide will lead you through creating a sample project using Manim: an animation engine for precise programmatic animations.
@@ -219,7 +314,8 @@ if __name__ == '__main__':
                 self.play(Transform(a,t))
     ```
     ---
-
+'''
+    instructions = '''
     You are an AI assistant that turns a user prompt into a visualization using manim.
     manim is a Python math animation engine that allows you to create animations programmatically.
     The user will ask you to create a specific type of animation and you will have to generate the code for it.
@@ -247,24 +343,37 @@ if __name__ == '__main__':
     2. Execute on your plan and generate the manim code for the visualization
     '''
     user_prompt = 'Explain gradient gradient descent using math animation.'
-    messages = [
-        {'role': 'system', 'content': system_message},
-        {'role': 'user', 'content': user_prompt},
-    ]
-    for _ in range(5):
-        model_response = get_response(messages)
-        messages.append(create_message('assistant', model_response))
-        python_code, filename = parse_python(model_response)
-        error = run_python_file(filename)
-        if error:
-            print(error)
-            messages.append(
-                create_message(
-                    'user', 
-                    f'Python code:\n```python\n{python_code}\n```\nError running python file:\n{error}\nIterate and make manim code that can {user_prompt}.'
-                )
-            )
-            continue
+
+    parser = argparse.ArgumentParser(description='Generate manim scenes for one prompt or a JSONL batch of prompts.')
+    parser.add_argument('input', nargs='?', help='JSONL file with one {"prompt": ..., "id": ..., "model": ...} job per line')
+    parser.add_argument('--output', default='results.jsonl', help='JSONL checkpoint file; succeeded job ids are skipped on rerun')
+    parser.add_argument('--skip-failed', action='store_true', help='on rerun, also skip jobs that failed')
+    parser.add_argument('--concurrency', type=int, default=2, help='jobs in flight at once')
+    parser.add_argument('--traces', help='append per-stage timing spans to this JSONL file')
+    parser.add_argument('--prompt', choices=PROMPT_MODES, default=prompt_mode,
+                        help='retrieval: instructions + matching docs snippets; static: the full quickstart every time')
+    args = parser.parse_args()
+    prompt_mode = args.prompt
+    # the static prompt is the quickstart pasted in front of the instructions, retrieval only adds what matches
+    system_message = quickstart + instructions if prompt_mode == 'static' else instructions
+
+    artifacts = ArtifactStore()
+    render_pool = RenderPool(render_workers, partial_cache_dir=artifacts.partial_dir)
+    render_cache = RenderCache()
+    llm_cache = ResponseCache()
+    fix_index = FixIndex()
+    tracer = Tracer(args.traces)
+
+    def run(job):
+        return run_job(job, system_message, llm_cache, render_pool, render_cache, artifacts, fix_index, tracer)
+
+    if args.input:
+        succeeded, total = run_batch(load_jobs(args.input), run, args.output, args.concurrency, args.skip_failed)
+        print(f'{succeeded} of {total} jobs succeeded')
+        exit(0)
+
+    result = run({'prompt': user_prompt})
+    if result['status'] == 'succeeded':
         exit(0)
-    print('5 errors... something probably went wrong -- increase range val, mess w/ model type, change prompt or change model and rerun')
-    exit(-1)
\ No newline at end of file
+    print(f'{retry_count} errors... something probably went wrong -- increase retry_count, mess w/ model type, change prompt or change model and rerun')
+    exit(-1)
@@ -1,14 +1,31 @@
 from dotenv import load_dotenv
-from openai import OpenAI
 import streamlit as st
-import subprocess
-import anthropic
-import ollama
+import altair as alt
+import pandas as pd
+import concurrent.futures
+import contextlib
+import hashlib
+import shutil
 import uuid
-import ast
-import re
+import sys
 import os
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from manimgpt import providers
+from manimgpt.artifacts import ArtifactStore
+from manimgpt.errors import extract_error_info
+from manimgpt.fixes import MAX_REPAIRS, FixIndex, FixLearner, repair
+from manimgpt.history import DEFAULT_TOKEN_BUDGET, ConversationHistory, budget_for_context, count_tokens
+from manimgpt.jobs import FINISHED, JobServer
+from manimgpt.llm_cache import ResponseCache
+from manimgpt.render_cache import RenderCache
+from manimgpt.render_pool import RenderPool
+from manimgpt.retrieval import PROMPT_MODES, assemble_system_message, load_index
+from manimgpt.scenes import extract_code, scene_classes
+from manimgpt.scheduler import RenderScheduler, chain
+from manimgpt.speculative import plan_candidates, race
+from manimgpt.tracing import Tracer, serve_metrics
+
 load_dotenv('../.ENV')
 
 model_to_context = {
@@ -16,150 +33,472 @@ model_to_context = {
     'deepseek-coder-v2': 16384,
 }
 
-def get_ollama_response(messages, model_id):
-    try:
-        response = ollama.chat(
-            model=model_id,
-            messages=messages,
-            stream=False,
-            options={
-                'temperature': 0,
-                'num_ctx': model_to_context[model_id],
-            }
-        )
-        return response['message']['content']
-    except Exception as e:
-        print(f'Error getting Ollama response: {e}')
-        exit(-1)
+def get_model_type(model_id):
+    if 'claude' in model_id:
+        return 'anthropic'
+    elif 'gpt' in model_id and model_id not in model_to_context.keys():
+        return 'openai'
+    else:
+        return 'ollama'
 
-def get_anthropic_response(messages, model_id):
-    try:
-        client = anthropic.Anthropic(api_key=os.getenv(key='ANTHROPIC_API_KEY'))
-        message = client.messages.create(
-            model=model_id,
-            max_tokens=1000,
-            temperature=0,
-            system=system_message,
-            messages=messages
-        )
-        return message.content
-    except Exception as e:
-        print(f'Error getting Anthropic response: {e}')
-        return e
+def get_model_options(model_type, model_id, temperature=0):
+    if model_type == 'ollama':
+        return {'temperature': temperature, 'num_ctx': model_to_context[model_id]}
+    elif model_type == 'anthropic':
+        return {'temperature': temperature, 'max_tokens': 1000}
+    return {'temperature': temperature}
 
-def get_openai_response(messages, model_id):
-    try:
-        client = OpenAI(api_key=os.getenv(key=os.getenv(key='OPENAI_API_KEY')))
-        completion = client.chat.completions.create(
-        model=model_id,
-        messages=messages
-        )
-        return completion.choices[0].message
-    except Exception as e:
-        print(f'Error getting OpenAI response: {e}')
-        return e
+@st.cache_resource
+def get_llm_cache():
+    return ResponseCache()
 
-def write_python_to_file(filename, python_content):
-    try:
-        with open(f'./test-scripts/{filename}.py', 'w+') as f:
-            f.write(python_content)
-    except Exception as e:
-        print(f'Error writing to python file: {e}')
-        exit(-1)
+def get_model_response(llm_cache, model_type, model_id, messages, bypass_cache, temperature=0, on_text=None, cancel=None):
+    options = get_model_options(model_type, model_id, temperature)
+    return llm_cache.cached(
+        model_type, model_id, options, messages,
+        lambda: providers.complete(model_type, model_id, messages, options, on_text, cancel),
+        bypass=bypass_cache
+    )
+
+def write_python_to_file(artifacts, python_content, meta, trace=None):
+    # scripts are content-addressed, so a retry that reproduces earlier code reuses its file
+    with trace.span('write', bytes_written=len(python_content.encode())) if trace else contextlib.nullcontext():
+        _, script_path = artifacts.put_text('script', python_content, **meta)
+    return script_path
 
-def parse_python(filename, model_response):
-    os.makedirs('./test-scripts', exist_ok=True)
+def parse_python(model_response):
     print(model_response)
-    python_match = re.search(r'```(?i:python)?([\s\S]*?)```', model_response)
-    if python_match:
-        python_code = python_match.group(1).strip()
-        if not is_valid_python_code(python_code):
-            print('Invalid Python code')
+    # all the python blocks in the response, merged, so scenes split across blocks all render
+    python_code = extract_code(model_response)
+    if not python_code:
+        print('No valid Python code in response')
+    return python_code
+
+def store_render_output(artifacts, kind, path, meta):
+    key, stored_path = artifacts.put_file(kind, path, move=True, **meta)
+    # the worker gave this job its own directory; nothing else in it is worth keeping
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+    return key, stored_path
+
+@st.cache_resource
+def get_artifact_store():
+    return ArtifactStore()
+
+@st.cache_resource
+def get_render_pool():
+    # one pool for the whole server, sized by MANIMGPT_RENDER_WORKERS
+    return RenderPool(partial_cache_dir=get_artifact_store().partial_dir)
+
+@st.cache_resource
+def get_render_scheduler():
+    return RenderScheduler(get_render_pool())
+
+@st.cache_resource
+def get_render_cache():
+    return RenderCache()
+
+@st.cache_resource
+def get_fix_index():
+    return FixIndex()
+
+@st.cache_resource
+def get_retrieval_index():
+    return load_index()
+
+def run_python_file(render_scheduler, render_cache, artifacts, script_path, python_code, class_names, meta, trace, report, scene_key=None, cancel=None):
+    with trace.span('render_cache') as span:
+        key = render_cache.key(python_code, ','.join(class_names))
+        cached = render_cache.get(key)
+        span['hit'] = cached is not None
+    if cached:
+        print(f'Render cache hit: {key}')
+        video_path, error = cached
+        if error:
+            return None, error
+        # dedupes against the stored copy and records this prompt/attempt as another user of it
+        return artifacts.put_file('video', video_path, **meta)[0], None
+    # catch NameErrors, bad kwargs etc. with a dry-run construct() before paying for a full render
+    with trace.span('validate') as span:
+        validations = render_scheduler.wait(
+            [render_scheduler.validate(script_path, name) for name in class_names or [None]], cancel
+        )
+        if validations is None:
+            return None, None
+        error = next((error for error in validations if error), None)
+        span['failed'] = bool(error)
+    if error:
+        print('Validation failed, skipping render')
+        artifacts.put_text('log', error, **meta)
+        return render_cache.store(key, None, error)
+    # a still of the final frame costs about as much as validation, so show it while the video renders
+    with trace.span('preview') as span:
+        preview = render_scheduler.wait([render_scheduler.preview(script_path, class_names[-1] if class_names else None)], cancel)
+        if preview is None:
+            return None, None
+        image_path, error = preview[0]
+        span['failed'] = bool(error)
+    if image_path:
+        report('preview', store_render_output(artifacts, 'image', image_path, meta)[1])
+    with trace.span('render') as span:
+        render = render_scheduler.wait([render_scheduler.render_scenes(script_path, class_names, scene_key=scene_key, stats=span)], cancel)
+        if render is not None:
+            video_path, error = render[0]
+            span['failed'] = bool(error)
+            if video_path:
+                span['bytes_written'] = os.path.getsize(video_path)
+    if scene_key:
+        # a cancelled render may still have written segments here
+        artifacts.track_dir('partial', os.path.join(render_scheduler.render_pool.partial_cache_dir, scene_key), **meta)
+    if render is None:
+        return None, None
+    if error:
+        artifacts.put_text('log', error, **meta)
+        return render_cache.store(key, None, error)
+    video_key, video_path = store_render_output(artifacts, 'video', video_path, meta)
+    render_cache.store(key, video_path, None)
+    return video_key, None
+
+def render_high_quality(render_scheduler, render_cache, artifacts, script_path, python_code, class_names, meta):
+    # returns a future of (video_key, error)
+    key = render_cache.key(python_code, ','.join(class_names), 'h')
+    cached = render_cache.get(key)
+    if cached:
+        video_path, error = cached
+        future = concurrent.futures.Future()
+        future.set_result((None, error) if error else (artifacts.put_file('video', video_path, **meta)[0], None))
+        return future
+
+    def store(result):
+        video_path, error = result
+        if error:
+            artifacts.put_text('log', error, **meta)
+            return render_cache.store(key, None, error)
+        video_key, video_path = store_render_output(artifacts, 'video', video_path, meta)
+        render_cache.store(key, video_path, None)
+        return video_key, None
+
+    # each scene queues as a high quality render of its own, behind everything a user is waiting on
+    return chain(render_scheduler.render_scenes(script_path, class_names, 'h'), store)
+
+def run_attempts(candidate, cancel, report, system_message, user_prompt, retry_count, token_budget, llm_cache, render_scheduler, render_cache, artifacts, fix_index, bypass_cache, trace, scene_key):
+    model_id, temperature = candidate
+    model_type = get_model_type(model_id)
+    if model_type == 'ollama':
+        token_budget = budget_for_context(model_to_context[model_id], token_budget)
+    history = ConversationHistory(system_message, user_prompt, token_budget)
+    learner = FixLearner(fix_index)
+
+    for i in range(retry_count):
+        if cancel.is_set():
             return None
-        write_python_to_file(filename, python_match.group(1).strip())
-        return python_code
-    else:
+        with trace.span('attempt', attempt=i):
+            outcome = run_attempt(
+                i, cancel, report, history, model_type, model_id, temperature, retry_count,
+                llm_cache, render_scheduler, render_cache, artifacts, learner, bypass_cache, trace, scene_key
+            )
+        if outcome == 'stop':
+            return None
+        if outcome:
+            return outcome
+    return None
+
+def run_attempt(i, cancel, report, history, model_type, model_id, temperature, retry_count, llm_cache, render_scheduler, render_cache, artifacts, learner, bypass_cache, trace, scene_key):
+    messages = history.messages()
+    prompt_tokens = history.total_tokens(messages)
+    report('status', f'Run {i} of {retry_count}: generating ({prompt_tokens} prompt tokens)...')
+    with trace.span('llm', prompt_tokens=prompt_tokens) as span:
+        result = get_model_response(
+            llm_cache, model_type, model_id, messages, bypass_cache, temperature,
+            on_text=lambda text: report('partial', text), cancel=cancel
+        )
+        span['cached'] = result.cached
+        if result.text:
+            span['completion_tokens'] = count_tokens(result.text)
+    if cancel.is_set():
+        return 'stop'
+    if result.error:
+        # rate limits and auth failures aren't something another generation can fix
+        report('error', result.error)
+        return 'stop'
+    model_response = result.text
+    with trace.span('parse'):
+        python_code = parse_python(model_response)
+    if not python_code:
+        report('error', 'No code in response. Trying again.')
+        history.add_attempt(model_response, None, None)
+        return None
+    meta = {'prompt': history.user_prompt, 'model': model_id, 'attempt': i}
+    script_path = write_python_to_file(artifacts, python_code, meta, trace)
+    class_names = scene_classes(python_code)
+    report('code', python_code)
+    report('status', f'Run {i} of {retry_count}: rendering...')
+    video_key, error = run_python_file(render_scheduler, render_cache, artifacts, script_path, python_code, class_names, meta, trace, report, scene_key, cancel)
+    if cancel.is_set():
+        # a cancelled render comes back without an error, which must not be learned as a fix
+        return 'stop'
+    learner.observe(python_code, error)
+    # known API renames and the like are fixed in place instead of paying for another generation
+    for _ in range(MAX_REPAIRS):
+        if not error or cancel.is_set():
+            break
+        with trace.span('repair') as span:
+            repaired, rules = repair(python_code, error)
+            span['rules'] = rules
+        if not repaired:
+            break
+        report('error', error)
+        report('status', f'Run {i} of {retry_count}: auto-repairing ({", ".join(rules)})...')
+        python_code = repaired
+        model_response = f'```python\n{python_code}\n```'
+        script_path = write_python_to_file(artifacts, python_code, meta, trace)
+        report('code', python_code)
+        video_key, error = run_python_file(render_scheduler, render_cache, artifacts, script_path, python_code, class_names, meta, trace, report, scene_key, cancel)
+        if cancel.is_set():
+            return 'stop'
+        learner.observe(python_code, error)
+    if error:
+        cleaned_error = extract_error_info(error)
+        report('error', error)
+        report('error', cleaned_error)
+        history.add_attempt(model_response, python_code, cleaned_error, learner.fix_index.hint(error))
         return None
+    if video_key:
+        return python_code, video_key, script_path, class_names
+    return None
 
-def run_python_file(filename):
+@st.cache_resource
+def get_tracer():
+    tracer = Tracer(os.getenv('MANIMGPT_TRACE_FILE', 'traces.jsonl'))
+    port = int(os.getenv('MANIMGPT_METRICS_PORT', 9464))
     try:
-        subprocess.check_output(
-            ['manim', '-pql', f'./test-scripts/{filename}.py', filename],
-            stderr=subprocess.STDOUT,
-            text=True
+        serve_metrics(tracer, port)
+        print(f'Serving metrics on http://127.0.0.1:{port}/metrics')
+    except OSError as e:
+        print(f'Could not start metrics server on port {port}: {e}')
+    return tracer
+
+def render_timeline(placeholder, spans):
+    if not spans:
+        placeholder.write('No spans recorded yet.')
+        return
+    origin = min(span['start'] for span in spans)
+    rows = [{
+        'lane': span['trace'],
+        'stage': span['name'],
+        'start': span['start'] - origin,
+        'end': span['start'] - origin + span['duration'],
+        'seconds': round(span['duration'], 3),
+        'attempt': span['attrs'].get('attempt'),
+    } for span in spans if span['name'] != 'attempt']
+    chart = alt.Chart(pd.DataFrame(rows)).mark_bar().encode(
+        x=alt.X('start:Q', title='seconds'),
+        x2='end:Q',
+        y=alt.Y('lane:N', title=None),
+        color='stage:N',
+        tooltip=['lane', 'stage', 'seconds', 'attempt'],
+    )
+    placeholder.altair_chart(chart, use_container_width=True)
+
+def run_llm(job):
+    # runs on a job server thread: no st.* calls here, everything the page shows goes through job.emit
+    params = job.params
+    model_ids = params['model_ids']
+    system_message = params['system_message']
+    user_prompt = params['user_prompt']
+    retry_count = params['retry_count']
+    prompt_mode = params['prompt_mode']
+    llm_cache = get_llm_cache()
+    render_scheduler = get_render_scheduler()
+    render_cache = get_render_cache()
+    artifacts = get_artifact_store()
+    fix_index = get_fix_index()
+    tracer = get_tracer()
+    if prompt_mode == 'retrieval':
+        system_message = assemble_system_message(system_message, user_prompt, get_retrieval_index())
+    job.emit('system_prompt', {'tokens': count_tokens(system_message), 'mode': prompt_mode})
+    candidates = plan_candidates(model_ids, params['candidate_count'])
+    traces = [tracer.trace(f'{i}: {model_id}', model=model_id, prompt_mode=prompt_mode) for i, (model_id, _) in enumerate(candidates)]
+    job.emit('candidates', {'candidates': candidates, 'trace_ids': [trace.trace_id for trace in traces]})
+    for model_id in model_ids:
+        if get_model_type(model_id) == 'ollama':
+            providers.preload(model_id)
+
+    def on_event(index, kind, payload):
+        if kind == 'partial':
+            # streamed text changes every few tokens; the page only ever needs the latest copy
+            job.progress[f'partial-{index}'] = payload
+            return
+        job.emit('candidate', [index, kind, payload])
+
+    def attempt(candidate_trace, cancel, report):
+        index, candidate, trace = candidate_trace
+        # every attempt from this candidate slot at this prompt, in any session, renders into the same
+        # partial movie cache; the other candidates racing it get their own, and sessions sharing one
+        # take turns (RenderPool locks each directory while a render uses it)
+        scene_key = hashlib.sha1(f'{user_prompt}\0{index}'.encode()).hexdigest()[:16] if params['incremental'] else None
+        return run_attempts(
+            candidate, cancel, report, system_message, user_prompt, retry_count, params['token_budget'],
+            llm_cache, render_scheduler, render_cache, artifacts, fix_index, params['bypass_cache'], trace, scene_key
         )
+
+    winner = race([(i, candidate, trace) for i, (candidate, trace) in enumerate(zip(candidates, traces))], attempt, on_event, stop=job.cancel)
+    if winner is None:
         return None
-    except subprocess.CalledProcessError as e:
-        return e.output
+    index, (python_code, video_key, script_path, class_names) = winner
+    job.emit('winner', index)
+    result = {'code': python_code, 'video_key': video_key, 'high_quality': None}
+    if params['high_quality']:
+        high_quality_renders = get_high_quality_renders()
+        previous = high_quality_renders.get(job.owner)
+        if previous:
+            # frees queue slots: a one-scene render that already started still finishes and is stored,
+            # and scenes of a longer one that already started have their clips thrown away
+            previous.cancel()
+        future = render_high_quality(
+            render_scheduler, render_cache, artifacts, script_path, python_code, class_names,
+            {'prompt': user_prompt, 'model': candidates[index][0], 'attempt': None}
+        )
+        high_quality_renders[job.owner] = future
+        future.add_done_callback(lambda future: record_high_quality(job.server, job.id, future))
+        result['high_quality'] = 'rendering'
+    return result
 
-def is_valid_python_code(code):
+def record_high_quality(job_server, job_id, future):
+    if future.cancelled():
+        job_server.update_result(job_id, high_quality='cancelled')
+        return
     try:
-        ast.parse(code)
-        return True
-    except SyntaxError as e:
-        print(f"SyntaxError: {e}")
-        return False
-
-def create_message(role, content):
-    return {
-        'role': role,
-        'content': content
-    }
-
-def parse_class_name(code):
-    match = re.search(r'class\s+(\w+)\s*\(', code)
-    if match:
-        return match.group(1)
+        video_key, error = future.result()
+    except Exception as e:
+        video_key, error = None, f'{type(e).__name__}: {e}'
+    job_server.update_result(job_id, high_quality='done', high_quality_key=video_key, high_quality_error=error)
+
+@st.cache_resource
+def get_high_quality_renders():
+    # owner -> their latest background render, so a new result can drop the one it replaces
+    return {}
+
+def recover_result(result):
+    # background renders die with the server process, so a result still waiting on one never gets it
+    if result.get('high_quality') == 'rendering':
+        return {'high_quality': 'cancelled'}
     return None
 
-def extract_error_info(error_message: str) -> str:
-    error_type_message = re.search(r'([A-Za-z]+Error: .+)', error_message)
-    if error_type_message:
-        error_type_message = error_type_message.group(1)
-    else:
-        error_type_message = "Error type and message not found."
-    return error_type_message
+@st.cache_resource
+def get_job_server():
+    # shared by every session; a refresh or a second tab reconnects to the same jobs by id
+    return JobServer(run_llm, os.getenv('MANIMGPT_JOBS_DB', 'jobs.sqlite'), recover=recover_result)
 
-def run_llm(model_id: str, model_type: str, messages: list, user_prompt: str, retry_count: int):
-    progress = st.text('Starting runs...')
-    filename = str(uuid.uuid4())
+def get_owner():
+    # a browser keeps its id in the URL, so reloading the page keeps its jobs and its fair share
+    if 'user' not in st.query_params:
+        st.query_params['user'] = uuid.uuid4().hex[:12]
+    return st.query_params['user']
 
-    for i in range(retry_count):
-        progress.text(f'Run {i} of {retry_count}...')
-        if model_type == 'ollama':
-            model_response = get_ollama_response(messages, model_id)
-        elif model_type == 'anthropic':
-            model_response = get_anthropic_response(messages, model_id)
-        elif model_type == 'openai':
-            model_response = get_openai_response(messages, model_id)
-        else:
-            st.write('Invalid model type -- this shouldn\'t happen')
-        messages.append(create_message('assistant', model_response))
-        python_code = parse_python(filename, model_response)
-        if not python_code:
-            st.write('No code in response. Trying again.')
-            messages.append(
-                create_message(
-                    'user', f'There was no Python code in your last response. Please provide manim code that can {user_prompt}.'
-                )
-            )
-            continue
-        class_name = parse_class_name(python_code)
-        current_code = st.code(body=python_code, language='python')
-        error = run_python_file(filename)
-        if error:
-            cleaned_error = extract_error_info(error)
-            st.write(error)
-            st.write(cleaned_error)
-            # current_code.empty()
-            messages.append(
-                create_message(
-                    'user', f'Python code:\n```python\n{python_code}\n```\nError running python file:\n{cleaned_error}\nIterate and make manim code that can {user_prompt}.'
-                )
-            )
-        else:
-            st.video(f'./media/videos/{filename}/480p15/{class_name}.mp4', format='video/mp4')
-            break
+def submit_job(params):
+    st.query_params['job'] = get_job_server().submit(get_owner(), params)
+
+def show_video(artifacts, video_key, caption=None):
+    video_path = artifacts.get(video_key)
+    if video_path is None:
+        st.write('This video has been evicted from the artifact store. Submit the prompt again to re-render it.')
+        return
+    st.video(video_path, format='video/mp4')
+    if caption:
+        st.caption(caption)
+    # pinned videos are never evicted, however far over quota the store gets
+    if st.button('KEEP VIDEO', key=f'keep-{video_key}'):
+        artifacts.pin(video_key)
+        st.caption('Kept.')
+
+def show_result(result):
+    artifacts = get_artifact_store()
+    st.code(body=result['code'], language='python')
+    if result['high_quality'] == 'done':
+        if result['high_quality_key']:
+            show_video(artifacts, result['high_quality_key'], '1080p60')
+            return
+        st.write(f'High quality render failed: {extract_error_info(result["high_quality_error"])}')
+    show_video(artifacts, result['video_key'], '480p15 -- rendering 1080p60 in the background...' if result['high_quality'] == 'rendering' else None)
+
+def job_active(job):
+    return job is not None and (job['status'] not in FINISHED or (job['result'] or {}).get('high_quality') == 'rendering')
+
+def show_job(job_id, polling):
+    job_server = get_job_server()
+    job = job_server.get(job_id)
+    if job is None:
+        st.write(f'No job with id {job_id}.')
+        return
+    if polling and not job_active(job):
+        # rerun the whole page once so it stops polling
+        st.rerun()
+    retry_count = job['params']['retry_count']
+    if job['status'] == 'queued':
+        st.text(f'Job {job_id}: queued ({job["position"]} ahead of it)')
+    elif job['status'] == 'running':
+        st.text(f'Job {job_id}: {"cancelling" if job["cancelling"] else "running"}')
+    if job['status'] not in FINISHED and not job['cancelling']:
+        if st.button('CANCEL', key=f'cancel-{job_id}'):
+            job_server.cancel(job_id)
+
+    panels = []
+    trace_ids = []
+    winner = None
+    for _, kind, payload in job_server.events(job_id):
+        if kind == 'system_prompt':
+            st.caption(f'System prompt: {payload["tokens"]} tokens ({payload["mode"]})')
+        elif kind == 'candidates':
+            trace_ids = payload['trace_ids']
+            panels = [{'candidate': candidate, 'status': None, 'code': None, 'preview': None, 'errors': []} for candidate in payload['candidates']]
+        elif kind == 'winner':
+            winner = payload
+        elif kind == 'candidate':
+            index, event, value = payload
+            panel = panels[index]
+            if event in ('status', 'code', 'preview'):
+                panel[event] = value
+            elif event == 'error':
+                panel['errors'].append(value)
+            elif event == 'failed':
+                panel['status'] = f'Failed: {value}' if value else f'Failed after {retry_count} runs'
+    for i, panel in enumerate(panels):
+        partial = job['progress'].get(f'partial-{i}')
+        if winner is not None:
+            panel['status'] = 'Succeeded' if i == winner else 'Cancelled'
+        elif job['status'] == 'cancelled':
+            panel['status'] = 'Cancelled'
+        model_id, temperature = panel['candidate']
+        with st.expander(label=f'{model_id} (temperature {temperature})', expanded=len(panels) == 1):
+            if panel['status']:
+                st.text(panel['status'])
+            if panel['code']:
+                st.code(body=panel['code'], language='python')
+            elif partial:
+                st.code(body=partial, language='markdown')
+            if panel['preview']:
+                st.image(panel['preview'], caption='Last frame preview')
+            for error in panel['errors']:
+                st.write(error)
+    if trace_ids:
+        # drawn here rather than in the sidebar: this fragment is what polls while the job runs,
+        # and fragments can't write to the sidebar
+        with st.expander(label='TIMELINE', expanded=job['status'] not in FINISHED):
+            render_timeline(st.empty(), get_tracer().spans_for(set(trace_ids)))
+
+    if job['status'] == 'succeeded':
+        show_result(job['result'])
+    elif job['status'] == 'failed':
+        st.write(job['error'] or f'No candidate produced a working video after {retry_count} runs.')
+    elif job['status'] == 'cancelled':
+        st.write('Cancelled.')
+
+def show_jobs(owner):
+    st.sidebar.subheader('JOBS')
+    for job in get_job_server().jobs_for(owner):
+        label = f'{job["status"]}: {job["params"]["user_prompt"][:40]}'
+        if st.sidebar.button(label, key=f'job-{job["id"]}'):
+            st.query_params['job'] = job['id']
 
 if __name__ == '__main__':
     system_message = '''You are an AI assistant that turns a user prompt into a visualization using manim.
@@ -192,29 +531,47 @@ You should do the following given a user prompt:
 3. Using your implementation, generate manim code for the visualization
 '''
 
+    show_jobs(get_owner())
+    # poll the job (and any background render it started) without rerunning the whole app
+    job_id = st.query_params.get('job')
+    if job_id:
+        polling = job_active(get_job_server().get(job_id))
+        st.experimental_fragment(show_job, run_every=1 if polling else None)(job_id, polling)
+
     with st.form(key='form_1'):
         with st.expander(label='SYSTEM MESSAGE'):
             system_message = st.text_area(label='SYSTEM MESSAGE', value=system_message, height=500)
         
-        model_id = st.selectbox(label='MODEL', options=['llama3', 'deepseek-coder-v2', 'claude-3-5-sonnet-20240620', 'gpt-3.5-turbo'])
-
-        model_type = ''
-        if 'claude' in model_id:
-            model_type = 'anthropic'
-        elif 'gpt' in model_id and model_id not in model_to_context.keys():
-            model_type = 'openai'
-        else:
-            model_type = 'ollama'
+        model_options = ['llama3', 'deepseek-coder-v2', 'claude-3-5-sonnet-20240620', 'gpt-3.5-turbo']
+        model_id = st.selectbox(label='MODEL', options=model_options)
+        if get_model_type(model_id) == 'ollama':
+            providers.preload(model_id)
 
         user_prompt = 'Explain backpropagation using math animation.'
         user_prompt = st.text_area(label='USER PROMPT', value=user_prompt)
 
-        messages = [
-            {'role': 'system', 'content': system_message},
-            {'role': 'user', 'content': user_prompt},
-        ]
-
         retry_count = 5
         retry_count = st.number_input(label='RETRY COUNT', value=retry_count, min_value=1)
 
-        st.form_submit_button(label='SUBMIT', on_click=run_llm, args=(model_id, model_type, messages, user_prompt, retry_count))
+        token_budget = DEFAULT_TOKEN_BUDGET
+        token_budget = st.number_input(label='PROMPT TOKEN BUDGET', value=token_budget, min_value=1024)
+
+        bypass_cache = st.checkbox(label='BYPASS LLM CACHE', value=False)
+        incremental = st.checkbox(label='INCREMENTAL RENDERING', value=True)
+        high_quality = st.checkbox(label='HIGH QUALITY RENDER (1080p60, BACKGROUND)', value=False)
+        # retrieval appends the manim docs snippets that match the prompt to the system message
+        prompt_mode = st.selectbox(label='PROMPT MODE', options=PROMPT_MODES)
+
+        with st.expander(label='SPECULATIVE GENERATION'):
+            candidate_count = 1
+            candidate_count = st.number_input(label='CANDIDATES', value=candidate_count, min_value=1)
+            extra_models = st.multiselect(label='EXTRA CANDIDATE MODELS', options=model_options)
+        model_ids = [model_id] + [m for m in extra_models if m != model_id]
+
+        params = {
+            'model_ids': model_ids, 'system_message': system_message, 'user_prompt': user_prompt,
+            'retry_count': retry_count, 'bypass_cache': bypass_cache,
+            'candidate_count': candidate_count, 'token_budget': token_budget, 'incremental': incremental,
+            'high_quality': high_quality, 'prompt_mode': prompt_mode,
+        }
+        st.form_submit_button(label='SUBMIT', on_click=submit_job, args=(params,))